@@ -0,0 +1,72 @@
+# Base class of the abstract domains run by the fixpoint engines in parser.py.
+#
+# A domain provides the lattice operations on values (lub) and on abstract states (merge,
+# isEqual) and the transfer function of a single CFG node. The batched operations are
+# built from those, and a domain overrides them when it can do better than one call per
+# state or per node (e.g. MatrixPointersDomain merges all states in one array operation).
+#
+# The capability flags tell the engines what a domain can do:
+#
+#   finiteHeight      every ascending chain of states is finite, so the fixpoint is reached
+#                     without widening. Solvers that cannot widen (SparseInterpretation,
+#                     demandQuery) only accept these domains.
+#   supportsBitset    values are ints with one bit per element, and lub(a, b) is
+#                     normalize(a | b). Solvers then join many values with a single or.
+#   supportsWidening  the domain defines widen(oldState, newState) and narrow(oldState,
+#                     newState), which the dense solvers apply at loop heads.
+#   constantTransfers the transfer of a node follows its instruction (see CFG.lower): only
+#                     the variable it writes changes, a copy gives it the value of the
+#                     source, and an allocation or null assignment gives it a value that
+#                     does not depend on the incoming state. Solvers that compute such a
+#                     value once instead of running the transfer (the block summaries of
+#                     BlockInterpretation, SparseInterpretation, demandQuery) rely on it.
+import functools
+
+
+class AbstractDomain:
+    finiteHeight = False
+    supportsBitset = False
+    supportsWidening = False
+    constantTransfers = False
+
+    topElement = None
+    bottomElement = None
+
+    # Returns the least upper bound of two values
+    def lub(self, a, b):
+        raise NotImplementedError
+
+    def isEqual(self, state1, state2):
+        raise NotImplementedError
+
+    # The state after executing block, given the state before it (currentState) and the
+    # state block had so far (nextAbstractState)
+    def statementTransfer(self, block, currentState, nextAbstractState):
+        raise NotImplementedError
+
+    def merge(self, abstractState1, abstractState2):
+        raise NotImplementedError
+
+    # The merge of a non-empty list of states, e.g. of the states flowing in from every
+    # predecessor of a node
+    def mergeMany(self, states):
+        return functools.reduce(self.merge, states)
+
+    # The state after executing the nodes of a straight-line block one after the other
+    def transferBlock(self, nodes, currentState):
+        for node in nodes:
+            currentState = self.statementTransfer(node, currentState, currentState)
+        return currentState
+
+    # Bitset domains map the or of their values to a value of the lattice (see supportsBitset)
+    def normalize(self, value):
+        return value
+
+    # States that were pickled in another process (see parallelSolver.py), made usable with
+    # the states of this one: index is the KeyIndex of this process, which every unpickled
+    # state replaces its own copy with. Domains that compare values by identity also have
+    # to make the values canonical again.
+    def importStates(self, states, index):
+        for state in states:
+            state.index = index
+        return states
@@ -0,0 +1,287 @@
+# Long-running analysis server on a local Unix domain socket, and its client.
+#
+# Starting parser.py costs the interpreter startup, the ANTLR imports and the deserialization
+# of the lexer and parser ATNs, which is far more than analyzing a typical program. The server
+# pays for this once: a pool of worker processes is started and warmed up, and every request
+# is analyzed by one of them.
+#
+#   python3 analysisServer.py serve [--socket PATH] [-j N] [--queue N] [--timeout SECONDS]
+#   python3 analysisServer.py client [--socket PATH] [--parser P] [--domain D] [--order O] program.c
+#
+# The client prints exactly what parser.py prints, so the tests can run against a server:
+#
+#   ANALYZER="python3 analysisServer.py client" ./run-tests.sh
+#
+# Protocol: one JSON object per line in each direction, any number of requests per connection.
+#
+#   {"op": "analyze", "program": "...", "options": {"parserName": ..., "domainName": ..., "order": ...}}
+#       -> {"ok": true, "cfg": [lines], "stateMap": {bbid: {var: [sites]}}, "states": [lines]}
+#   {"op": "stats"} -> {"ok": true, "stats": {...}}
+#
+# A failed request gets {"error": ...}. At most workers + queue requests are accepted at a
+# time; more are refused right away with {"error": ..., "busy": true} (the client retries
+# them with a growing delay). A request that takes longer than the timeout is answered with
+# {"error": ..., "timeout": true}. A worker of a pool cannot be stopped on its own, so the
+# pool is terminated and a new one started; the other requests that were running on it are
+# submitted to the new pool.
+import argparse
+import asyncio
+import collections
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import stat
+import sys
+import tempfile
+import time
+
+from batchAnalysis import analyzeSource, warmupProgram
+from parser import AbstractInterpretation, domains
+
+defaultSocket = os.environ.get('ANALYSIS_SOCKET', os.path.join(tempfile.gettempdir(), 'pointers-analysis.sock'))
+
+optionChoices = {
+    'parserName': ('antlr', 'fast'),
+    'domainName': tuple(sorted(domains)),
+    'order': AbstractInterpretation.orders,
+}
+
+
+def initWorker():
+    for parserName in optionChoices['parserName']:
+        analyzeSource(warmupProgram, parserName)
+
+
+# Failures are returned as data: the pool could not hand an exception back if it cannot be
+# pickled, and the request would never be answered
+def analyzeRequest(program_str, options):
+    try:
+        return analyzeSource(program_str, stateLines=True, **options)
+    except Exception as e:
+        return {'error': '{}: {}'.format(type(e).__name__, e)}
+
+
+# The options of a request, or a string describing what is wrong with them
+def checkOptions(options):
+    if not isinstance(options, dict):
+        return 'options must be an object'
+    for name, value in options.items():
+        if name not in optionChoices:
+            return 'unknown option {!r}'.format(name)
+        if value not in optionChoices[name]:
+            return 'option {} must be one of {}'.format(name, ', '.join(optionChoices[name]))
+    return options
+
+
+class AnalysisServer:
+    def __init__(self, path, workers=None, queueSize=16, timeout=60.0, maxRequestBytes=64 * 1024 * 1024):
+        self.path = path
+        self.workers = workers or os.cpu_count() or 1
+        self.capacity = self.workers + queueSize
+        self.timeout = timeout
+        self.maxRequestBytes = maxRequestBytes
+        self.pool = None
+        # future -> (program, options) of every request submitted to the pool
+        self.running = {}
+        self.pending = 0
+        self.counters = collections.Counter()
+
+    async def respond(self, line):
+        try:
+            request = json.loads(line)
+        except ValueError:
+            return {'error': 'malformed request'}
+        if not isinstance(request, dict):
+            return {'error': 'malformed request'}
+        op = request.get('op', 'analyze')
+        if op == 'stats':
+            stats = dict(self.counters, pending=self.pending, capacity=self.capacity, workers=self.workers)
+            return {'ok': True, 'stats': stats}
+        if op != 'analyze':
+            return {'error': 'unknown op {!r}'.format(op)}
+        program_str = request.get('program')
+        if not isinstance(program_str, str):
+            return {'error': 'program must be a string'}
+        options = checkOptions(request.get('options', {}))
+        if isinstance(options, str):
+            return {'error': options}
+        if self.pending >= self.capacity:
+            self.counters['rejected'] += 1
+            return {'error': 'server busy', 'busy': True}
+
+        self.pending += 1
+        future = self.submit(program_str, options)
+        try:
+            result = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self.counters['timeouts'] += 1
+            if future in self.running:
+                await self.restartPool()
+            return {'error': 'analysis timed out after {}s'.format(self.timeout), 'timeout': True}
+        except Exception as e:
+            self.counters['failed'] += 1
+            return {'error': '{}: {}'.format(type(e).__name__, e)}
+        if 'error' in result:
+            self.counters['failed'] += 1
+            return result
+        self.counters['analyzed'] += 1
+        result['ok'] = True
+        return result
+
+    # A future for the analysis of a program by a worker
+    def submit(self, program_str, options):
+        future = asyncio.get_running_loop().create_future()
+        self.running[future] = (program_str, options)
+        self.dispatch(future)
+        return future
+
+    # Hands a running request to the current pool. The pool calls back from its result thread,
+    # so the outcome is handed over to the event loop; outcomes from a pool that has been
+    # terminated since are dropped, as the request has been submitted again or answered.
+    def dispatch(self, future):
+        loop = asyncio.get_running_loop()
+        pool = self.pool
+
+        def settle(setter, value):
+            if pool is not self.pool or future not in self.running:
+                return
+            del self.running[future]
+            self.pending -= 1
+            # Nobody waits for the result of a request that timed out meanwhile
+            if not future.cancelled():
+                setter(value)
+
+        pool.apply_async(analyzeRequest, self.running[future],
+                         callback=lambda result: loop.call_soon_threadsafe(settle, future.set_result, result),
+                         error_callback=lambda e: loop.call_soon_threadsafe(settle, future.set_exception, e))
+
+    def startPool(self):
+        self.pool = multiprocessing.Pool(self.workers, initializer=initWorker)
+
+    # Stops the analyses of the requests that timed out (their futures are cancelled by
+    # wait_for), together with every other analysis in the pool, and submits the others to a
+    # new pool
+    async def restartPool(self):
+        for future in [future for future in self.running if future.cancelled()]:
+            del self.running[future]
+            self.pending -= 1
+        pool = self.pool
+        self.startPool()
+        self.counters['restarts'] += 1
+        for future in self.running:
+            self.dispatch(future)
+
+        def stop():
+            pool.terminate()
+            pool.join()
+        await asyncio.get_running_loop().run_in_executor(None, stop)
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    writer.write((json.dumps({'error': 'request larger than {} bytes'.format(self.maxRequestBytes)}) + '\n').encode())
+                    break
+                if not line:
+                    break
+                response = await self.respond(line)
+                writer.write((json.dumps(response) + '\n').encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        # A socket left behind by a server that died is removed, one still in use is not
+        if os.path.exists(self.path) and stat.S_ISSOCK(os.stat(self.path).st_mode):
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                if probe.connect_ex(self.path) == 0:
+                    raise RuntimeError('an analysis server is already listening on {}'.format(self.path))
+            os.unlink(self.path)
+        self.startPool()
+        server = await asyncio.start_unix_server(self.handle, self.path, limit=self.maxRequestBytes)
+        os.chmod(self.path, 0o600)
+        stop = asyncio.get_running_loop().create_future()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            asyncio.get_running_loop().add_signal_handler(signum, lambda: stop.done() or stop.set_result(None))
+        print('analysis server listening on {} with {} workers'.format(self.path, self.workers), file=sys.stderr)
+        async with server:
+            await stop
+        os.unlink(self.path)
+        # Analyses still running are abandoned rather than waited for
+        self.pool.terminate()
+        self.pool.join()
+
+
+def readLine(sock):
+    chunks = []
+    while True:
+        chunk = sock.recv(1 << 16)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        if chunk.endswith(b'\n'):
+            break
+    return b''.join(chunks)
+
+
+# Sends one request and returns the response. Requests refused because the server is busy
+# are sent again after 0.05s, 0.1s, 0.2s, ...
+def request(path, message, retries=8):
+    data = (json.dumps(message) + '\n').encode()
+    for attempt in range(retries + 1):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(path)
+            sock.sendall(data)
+            line = readLine(sock)
+        if not line:
+            raise ConnectionError('connection closed by the analysis server')
+        response = json.loads(line)
+        if not response.get('busy') or attempt == retries:
+            return response
+        time.sleep(0.05 * 2 ** attempt)
+
+
+if __name__ == '__main__':
+    argParser = argparse.ArgumentParser(description='Pointer analysis server on a Unix domain socket')
+    commands = argParser.add_subparsers(dest='command', required=True)
+    serveParser = commands.add_parser('serve', help='run the server')
+    serveParser.add_argument('--socket', default=defaultSocket, help='path of the socket (default {})'.format(defaultSocket))
+    serveParser.add_argument('-j', '--jobs', type=int, default=None, help='worker processes (default: number of CPUs)')
+    serveParser.add_argument('--queue', type=int, default=16, help='requests waiting for a worker before new ones are refused')
+    serveParser.add_argument('--timeout', type=float, default=60.0, help='seconds before a request is answered with an error')
+    clientParser = commands.add_parser('client', help='analyze a program with a running server')
+    clientParser.add_argument('input_file')
+    clientParser.add_argument('--socket', default=defaultSocket)
+    clientParser.add_argument('--parser', choices=optionChoices['parserName'], default='antlr')
+    clientParser.add_argument('--domain', choices=optionChoices['domainName'], default='sets')
+    clientParser.add_argument('--order', choices=optionChoices['order'], default='fifo')
+    args = argParser.parse_args()
+
+    if args.command == 'serve':
+        try:
+            asyncio.run(AnalysisServer(args.socket, args.jobs, args.queue, args.timeout).serve())
+        except RuntimeError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+        sys.exit(0)
+
+    with open(args.input_file) as f:
+        program_str = f.read()
+    response = request(args.socket, {'op': 'analyze', 'program': program_str,
+                                     'options': {'parserName': args.parser, 'domainName': args.domain, 'order': args.order}})
+    if not response.get('ok'):
+        print('[analysis server] {}'.format(response.get('error')), file=sys.stderr)
+        sys.exit(1)
+    print('--------------')
+    for line in response['cfg']:
+        print(line)
+    print('--------------')
+    for line in response['states']:
+        print(line)
+    print('--------------')
@@ -0,0 +1,116 @@
+# Runs the pointer analysis over many programs with a pool of worker processes.
+#
+# Every worker imports the parser once and warms it up on a tiny program, so the cost of
+# starting Python and loading the ANTLR runtime is paid once per worker instead of once per
+# file. One JSON record is written per file as soon as it is analyzed:
+#
+#   {"file": ..., "cfg": [lines printed by printCFG], "stateMap": {bbid: {var: [sites]}}}
+#
+# A file that cannot be analyzed produces {"file": ..., "error": ...} and the batch goes on.
+#
+# usage: python3 batchAnalysis.py [-j N] [-o results.jsonl] (dir | file | --file-list LIST)...
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import sys
+
+from cfgCache import CFGCache
+from parser import AbstractInterpretation, CFG, domains, loadProgram
+from resultWriter import jsonValue, writeText
+
+warmupProgram = 'x := newObject T1; if (x) { y := x; } else { y := null; }; while (y) { skip; };'
+
+
+# Analyzes one program and returns its JSON record (without the file name). With
+# stateLines the record also holds the states as printed by parser.py ("states"). A program
+# with a syntax error raises a ParseError with either parser.
+def analyzeSource(program_str, parserName='antlr', domainName='sets', order='fifo', cache=None, stateLines=False):
+    ast, cfg = loadProgram(program_str, parserName, cache, strict=True)
+    absInterp = AbstractInterpretation(ast, cfg, domains[domainName](cfg), order)
+    absInterp.run()
+    stateMap = {}
+    for key in absInterp.stateMap:
+        state = absInterp.getAbsState(key)
+        stateMap[key] = {var: jsonValue(state[var]) for var in sorted(state)}
+    record = {'cfg': CFG.listCFG(cfg.startNode, []), 'stateMap': stateMap}
+    if stateLines:
+        out = io.StringIO()
+        writeText(absInterp, out)
+        record['states'] = out.getvalue().splitlines()
+    return record
+
+
+workerOptions = {}
+
+# cacheDir is turned into a CFGCache per worker, all workers share the directory
+def initWorker(options, cacheDir=None, cacheBytes=None):
+    workerOptions.update(options)
+    analyzeSource(warmupProgram, **workerOptions)
+    if cacheDir:
+        workerOptions['cache'] = CFGCache(cacheDir, cacheBytes)
+
+
+def analyzeFile(path):
+    record = {'file': path}
+    try:
+        with open(path) as f:
+            record.update(analyzeSource(f.read(), **workerOptions))
+    except Exception as e:
+        record['error'] = '{}: {}'.format(type(e).__name__, e)
+    return record
+
+
+# Expands directories into the programs (*.c) they contain, in a stable order
+def collectFiles(paths, fileLists):
+    files = []
+    for listPath in fileLists:
+        with open(listPath) as f:
+            paths = paths + [line.strip() for line in f if line.strip()]
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                files.extend(os.path.join(root, name) for name in sorted(names) if name.endswith('.c'))
+        else:
+            files.append(path)
+    return files
+
+
+def runBatch(files, out, jobs=None, chunksize=8, cacheDir=None, cacheBytes=None, **options):
+    failures = 0
+    with multiprocessing.Pool(jobs, initializer=initWorker, initargs=(options, cacheDir, cacheBytes)) as pool:
+        for record in pool.imap(analyzeFile, files, chunksize):
+            if 'error' in record:
+                failures += 1
+            out.write(json.dumps(record) + '\n')
+            out.flush()
+    return failures
+
+
+if __name__ == '__main__':
+    argParser = argparse.ArgumentParser(description='Pointer analysis over many programs')
+    argParser.add_argument('paths', nargs='*', help='programs or directories containing *.c programs')
+    argParser.add_argument('--file-list', action='append', default=[],
+                           help='file with one program path per line')
+    argParser.add_argument('-j', '--jobs', type=int, default=None,
+                           help='number of worker processes (default: number of CPUs)')
+    argParser.add_argument('--chunksize', type=int, default=8,
+                           help='number of files handed to a worker at a time')
+    argParser.add_argument('-o', '--output', default='-', help='JSONL output file (default: stdout)')
+    argParser.add_argument('--parser', choices=('antlr', 'fast'), default='antlr')
+    argParser.add_argument('--cache-dir', metavar='DIR', help='share a parse/CFG cache in DIR between workers')
+    argParser.add_argument('--cache-size', type=int, default=256, metavar='MB')
+    argParser.add_argument('--domain', choices=sorted(domains), default='sets')
+    argParser.add_argument('--order', choices=AbstractInterpretation.orders, default='fifo')
+    args = argParser.parse_args()
+
+    files = collectFiles(args.paths, args.file_list)
+    out = sys.stdout if args.output == '-' else open(args.output, 'w')
+    failures = runBatch(files, out, args.jobs, args.chunksize, args.cache_dir, args.cache_size * 1024 * 1024,
+                        parserName=args.parser, domainName=args.domain, order=args.order)
+    if out is not sys.stdout:
+        out.close()
+    print('{} files analyzed, {} failed'.format(len(files), failures), file=sys.stderr)
+    sys.exit(1 if failures else 0)
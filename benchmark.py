@@ -0,0 +1,186 @@
+# Times every phase of the pointer analysis on generated programs and on tests/*.c.
+#
+#   python3 benchmark.py -o bench.json              run the default suite
+#   python3 benchmark.py --compare old.json new.json
+#
+# The phases are parse (lexing and parsing), cfg (CFG construction), getList, fixpoint
+# (AbstractInterpretation, including its initial state map, and run) and print
+# (printAbsState into a buffer). Times are the minimum over --repeat runs. Peak memory per
+# phase is measured in one extra run under tracemalloc, so tracing does not distort the times.
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from parser import AbstractInterpretation, CFG, domains, parseProgram
+from programGenerator import generateNested, generateProgram
+
+phases = ('parse', 'cfg', 'getList', 'fixpoint', 'print')
+
+# name -> arguments of generateProgram
+suites = {
+    'quick': {
+        'small': dict(statements=200, depth=3, variables=10, sites=20),
+        'medium': dict(statements=2000, depth=4, variables=30, sites=200),
+    },
+    'default': {
+        'small': dict(statements=200, depth=3, variables=10, sites=20),
+        'medium': dict(statements=2000, depth=4, variables=30, sites=200),
+        'large': dict(statements=10000, depth=5, variables=50, sites=1000),
+        'wide': dict(statements=5000, depth=2, variables=500, sites=2000),
+        'loops': dict(statements=5000, depth=8, variables=20, sites=500, controlRate=0.3),
+    },
+    # Many variables and allocation sites per state, to compare the set, bit-vector and
+    # matrix domains: run it once per --domain and --compare the result files
+    'wide': {
+        'wide-200x500': dict(statements=1000, depth=2, variables=200, sites=500),
+        'wide-500x1000': dict(statements=1500, depth=2, variables=500, sites=1000),
+    },
+}
+
+
+def runPhases(program_str, parserName, domainName, order, clock):
+    ast = clock('parse', lambda: parseProgram(program_str, parserName))
+    cfg = clock('cfg', lambda: CFG(ast))
+    clock('getList', cfg.getList)
+
+    def fixpoint():
+        absInterp = AbstractInterpretation(ast, cfg, domains[domainName](cfg), order)
+        absInterp.run()
+        return absInterp
+    absInterp = clock('fixpoint', fixpoint)
+
+    def printResult():
+        with contextlib.redirect_stdout(io.StringIO()):
+            absInterp.printAbsState()
+    clock('print', printResult)
+    return cfg
+
+
+def timePhases(program_str, parserName, domainName, order):
+    times = {}
+
+    def clock(phase, fn):
+        start = time.perf_counter()
+        result = fn()
+        times[phase] = time.perf_counter() - start
+        return result
+    cfg = runPhases(program_str, parserName, domainName, order, clock)
+    return times, cfg
+
+
+def tracePhases(program_str, parserName, domainName, order):
+    peaks = {}
+
+    def clock(phase, fn):
+        tracemalloc.reset_peak()
+        start = tracemalloc.get_traced_memory()[0]
+        result = fn()
+        peaks[phase] = tracemalloc.get_traced_memory()[1] - start
+        return result
+    tracemalloc.start()
+    try:
+        runPhases(program_str, parserName, domainName, order, clock)
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def benchmarkProgram(name, program_str, args):
+    best = None
+    for i in range(args.repeat):
+        times, cfg = timePhases(program_str, args.parser, args.domain, args.order)
+        if best is None:
+            best = times
+        else:
+            best = {phase: min(best[phase], times[phase]) for phase in phases}
+    record = {
+        'program': name,
+        'bytes': len(program_str),
+        'nodes': cfg.maxBBId + 1,
+        'times': best,
+        'total': sum(best.values()),
+    }
+    if args.memory:
+        record['peakMemory'] = tracePhases(program_str, args.parser, args.domain, args.order)
+    return record
+
+
+def gitRevision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def workloads(args):
+    for name, params in sorted(suites[args.suite].items()):
+        yield name, generateProgram(seed=args.seed, **params)
+    yield 'nested', generateNested(args.nesting)
+    testDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests')
+    for path in sorted(glob.glob(os.path.join(testDir, '*.c'))):
+        with open(path) as f:
+            yield 'tests/' + os.path.basename(path), f.read()
+
+
+# Prints the ratio new/old of every phase and of the total for the programs in both files
+def compare(oldPath, newPath):
+    with open(oldPath) as f:
+        old = {record['program']: record for record in json.load(f)['results']}
+    with open(newPath) as f:
+        new = json.load(f)['results']
+    for record in new:
+        before = old.get(record['program'])
+        if before is None:
+            continue
+        cells = []
+        for phase in phases + ('total',):
+            previous = before['times'].get(phase) if phase != 'total' else before['total']
+            current = record['times'].get(phase) if phase != 'total' else record['total']
+            if previous:
+                cells.append('{} {:.2f}x'.format(phase, current / previous))
+        print('{:<16} {}'.format(record['program'], '  '.join(cells)))
+
+
+if __name__ == '__main__':
+    argParser = argparse.ArgumentParser(description='Benchmark the phases of the pointer analysis')
+    argParser.add_argument('-o', '--output', default='bench.json', help='JSON file for the results')
+    argParser.add_argument('--suite', choices=sorted(suites), default='default')
+    argParser.add_argument('--repeat', type=int, default=3)
+    argParser.add_argument('--seed', type=int, default=0)
+    argParser.add_argument('--nesting', type=int, default=200, help='depth of the nested-loops workload')
+    argParser.add_argument('--no-memory', dest='memory', action='store_false',
+                           help='skip the tracemalloc run that records peak memory')
+    argParser.add_argument('--parser', choices=('antlr', 'fast'), default='antlr')
+    argParser.add_argument('--domain', choices=sorted(domains), default='sets')
+    argParser.add_argument('--order', choices=AbstractInterpretation.orders, default='fifo')
+    argParser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                           help='compare two result files instead of running the benchmark')
+    args = argParser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit(0)
+
+    results = []
+    for name, program_str in workloads(args):
+        record = benchmarkProgram(name, program_str, args)
+        results.append(record)
+        print('{:<16} {:>7} nodes  {}  total {:.3f}s'.format(
+            name, record['nodes'], '  '.join('{} {:.3f}s'.format(phase, record['times'][phase]) for phase in phases),
+            record['total']), file=sys.stderr)
+    with open(args.output, 'w') as f:
+        json.dump({
+            'revision': gitRevision(),
+            'python': platform.python_version(),
+            'options': {'parser': args.parser, 'domain': args.domain, 'order': args.order, 'suite': args.suite},
+            'results': results,
+        }, f, indent=1)
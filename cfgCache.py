@@ -0,0 +1,114 @@
+# On-disk cache for the parse/CFG phase, keyed by the program text.
+#
+# An entry is the JSON form of a CFG and its variables (see CFG.serialize), stored under the
+# SHA-256 of the grammar, the entry format, the parser that built it, whether the parse was
+# strict and the program text. A hit is loaded without running the lexer or the parser.
+#
+# Several processes may share a cache directory: entries are written to a temporary file and
+# renamed into place, so readers never see a partial entry, and only one process at a time
+# evicts (guarded by a lock file). The least recently used entries are evicted once the
+# cache grows beyond maxBytes; a hit refreshes the entry's modification time.
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+
+FORMAT_VERSION = 1
+
+
+def grammarVersion():
+    grammar = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pointers.g4')
+    try:
+        with open(grammar, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return 'unknown'
+
+
+class CFGCache:
+    def __init__(self, directory, maxBytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.prefix = '{}:{}:'.format(grammarVersion(), FORMAT_VERSION).encode()
+        self.hits = 0
+        self.misses = 0
+        # Bytes written since the size of the cache was last checked. The directory is only
+        # scanned again after a tenth of maxBytes has been written.
+        self.bytesWritten = maxBytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, program_str, parserName, strict):
+        options = '{}:{}:'.format(parserName, int(bool(strict))).encode()
+        return hashlib.sha256(self.prefix + options + program_str.encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key[2:] + '.json')
+
+    # Returns the stored entry or None
+    def load(self, program_str, parserName, strict):
+        path = self.path(self.key(program_str, parserName, strict))
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def store(self, program_str, parserName, strict, entry):
+        path = self.path(self.key(program_str, parserName, strict))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps(entry, separators=(',', ':'))
+        fd, tmpPath = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(data)
+            os.replace(tmpPath, path)
+        except OSError:
+            try:
+                os.unlink(tmpPath)
+            except OSError:
+                pass
+            return
+        self.bytesWritten += len(data)
+        if self.bytesWritten * 10 >= self.maxBytes:
+            self.evict()
+
+    # Deletes the least recently used entries until the cache uses at most 90% of maxBytes
+    def evict(self):
+        self.bytesWritten = 0
+        with open(os.path.join(self.directory, 'lock'), 'w') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EACCES):
+                    return
+                raise
+            entries = []
+            total = 0
+            for root, dirs, names in os.walk(self.directory):
+                for name in names:
+                    if not name.endswith('.json'):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        info = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((info.st_mtime, info.st_size, path))
+                    total += info.st_size
+            if total <= self.maxBytes:
+                return
+            entries.sort()
+            for mtime, size, path in entries:
+                if total <= self.maxBytes * 0.9:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
@@ -0,0 +1,40 @@
+# Writes a CFG as DOT or GraphML straight from its tables, without networkx.
+#
+# Nodes are identified by their bbid and labelled like CFG.drawCFG labels them
+# ("[Id: 3]: x:=y"). Lines are written as they are produced, so nothing but the CFG itself
+# is held in memory.
+from xml.sax.saxutils import escape, quoteattr
+
+nodeFormatStr = "[Id: {}]: {}"
+
+
+def dotString(text):
+    return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def writeDot(cfg, path):
+    with open(path, 'w') as f:
+        f.write('strict digraph "" {\n')
+        for node in cfg.nodes:
+            f.write('\t{} [label={}];\n'.format(node.bbid, dotString(nodeFormatStr.format(node.bbid, node.text))))
+        for bbid, successors in enumerate(cfg.succs):
+            for nextBbid in successors:
+                f.write('\t{} -> {};\n'.format(bbid, nextBbid))
+        f.write('}\n')
+
+
+def writeGraphML(cfg, path):
+    with open(path, 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n')
+        f.write('  <key id="label" for="node" attr.name="label" attr.type="string"/>\n')
+        f.write('  <key id="kind" for="node" attr.name="kind" attr.type="string"/>\n')
+        f.write('  <graph id="cfg" edgedefault="directed">\n')
+        for node in cfg.nodes:
+            f.write('    <node id="{}"><data key="label">{}</data><data key="kind">{}</data></node>\n'.format(
+                node.bbid, escape(nodeFormatStr.format(node.bbid, node.text)), escape(str(node.kind))))
+        for bbid, successors in enumerate(cfg.succs):
+            for nextBbid in successors:
+                f.write('    <edge source={} target={}/>\n'.format(quoteattr(str(bbid)), quoteattr(str(nextBbid))))
+        f.write('  </graph>\n')
+        f.write('</graphml>\n')
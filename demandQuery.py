@@ -0,0 +1,171 @@
+# Demand-driven points-to queries: what may a variable point to after a given node?
+#
+# A fact is a (variable slot, bbid) pair, the value of the variable in the state of the node.
+# It depends only on a constant (the node allocates or assigns null to the variable) or on
+# facts of the node's predecessors: the same variable, or the source of a copy into it. A
+# node with one predecessor that does not assign the variable has the value of its
+# predecessor, so such nodes are skipped and a slice only holds facts at definitions and
+# merge points. A query collects this backward slice of facts and solves only the slice.
+# Every solved fact is kept, so later queries stop their slice at facts that are known.
+#
+# When a slice grows beyond fallbackRatio * (number of nodes) facts, solving it would cost
+# about as much as analyzing the whole program: the exhaustive solver is run once instead and
+# answers this and every later query. Facts are only solved for domains with constant
+# transfers (see AbstractDomain.constantTransfers): the value of a fact at an allocation or
+# null assignment is computed once, from the bottom state. For other domains every query is
+# answered by the exhaustive solver.
+#
+#   python3 demandQuery.py program.c x@9 y@end      prints what x may point to after node 9
+#                                                   and y after the End node
+import argparse
+import collections
+import sys
+
+from parser import AbstractInterpretation, CFG, domains, parseProgram, programVariables
+from persistentMap import PersistentMap
+from instructions import COPY, NOP
+
+
+class DemandAnalysis:
+    def __init__(self, ast, cfg, absDomain, fallbackRatio=0.5):
+        if hasattr(absDomain, 'initialState') or not absDomain.finiteHeight:
+            raise ValueError('Demand queries need PersistentMap states and a domain of finite height')
+        self.ast = ast
+        self.cfg = cfg
+        self.absDomain = absDomain
+        self.fallbackRatio = fallbackRatio
+        self.bottomState = PersistentMap.fromKeys(programVariables(ast), absDomain.bottomElement)
+        cfg.lower(self.bottomState.index)
+        self.slots = self.bottomState.index.slots
+        self.constants = {}
+        # Value of every solved fact
+        self.values = {}
+        self.exhaustive = None
+        self.queries = 0
+        self.memoHits = 0
+        self.factsSolved = 0
+
+    # The value a node that allocates or assigns null gives its variable
+    def constant(self, bbid):
+        value = self.constants.get(bbid)
+        if value is None:
+            node = self.cfg.nodes[bbid]
+            value = self.absDomain.statementTransfer(node, self.bottomState, self.bottomState).getSlot(node.instr[1])
+            self.constants[bbid] = value
+        return value
+
+    # Facts the value of a fact is the lub of, or None if it is the constant of the node
+    def inputs(self, slot, bbid):
+        op, dst, src = self.cfg.nodes[bbid].instr
+        if op != NOP and dst == slot:
+            if op != COPY:
+                return None
+            slot = src
+        return [self.representative(slot, pred) for pred in self.cfg.preds[bbid]]
+
+    # The first fact on the way back from (slot, bbid) that is solved already, or whose node
+    # assigns the variable or has several predecessors. All facts on the way have its value.
+    def representative(self, slot, bbid):
+        nodes = self.cfg.nodes
+        preds = self.cfg.preds
+        while (slot, bbid) not in self.values:
+            op, dst, src = nodes[bbid].instr
+            if (op != NOP and dst == slot) or len(preds[bbid]) != 1:
+                break
+            bbid = preds[bbid][0]
+        return (slot, bbid)
+
+    # The unsolved facts the fact depends on, with their inputs, or None if there are too many
+    def backwardSlice(self, fact):
+        limit = self.fallbackRatio * len(self.cfg.nodes)
+        inputs = {fact: self.inputs(*fact)}
+        stack = [fact]
+        while stack:
+            for dependency in inputs[stack.pop()] or ():
+                if dependency in self.values or dependency in inputs:
+                    continue
+                inputs[dependency] = self.inputs(*dependency)
+                if len(inputs) > limit:
+                    return None
+                stack.append(dependency)
+        return inputs
+
+    # Least fixpoint of the facts of a slice, re-evaluating a fact only when one of its
+    # inputs changed
+    def solve(self, inputs):
+        bottom = self.absDomain.bottomElement
+        lub = self.absDomain.lub
+        bitset = self.absDomain.supportsBitset
+        users = collections.defaultdict(list)
+        values = {}
+        for fact, dependencies in inputs.items():
+            if dependencies is None:
+                values[fact] = self.constant(fact[1])
+                continue
+            values[fact] = bottom
+            for dependency in dependencies:
+                if dependency in inputs:
+                    users[dependency].append(fact)
+        work = collections.deque(fact for fact, dependencies in inputs.items() if dependencies is not None)
+        queued = set(work)
+        while work:
+            fact = work.popleft()
+            queued.discard(fact)
+            value = bottom
+            for dependency in inputs[fact]:
+                dependencyValue = values[dependency] if dependency in values else self.values[dependency]
+                value = value | dependencyValue if bitset else lub(value, dependencyValue)
+            if bitset:
+                value = self.absDomain.normalize(value)
+            if value != values[fact]:
+                values[fact] = value
+                for user in users[fact]:
+                    if user not in queued:
+                        queued.add(user)
+                        work.append(user)
+        self.factsSolved += len(values)
+        self.values.update(values)
+
+    def decode(self, value):
+        decode = getattr(self.absDomain, 'decode', None)
+        return decode(value) if decode else value
+
+    # What var may point to in the state of node bbid (after executing it)
+    def query(self, var, bbid):
+        self.queries += 1
+        if self.exhaustive is None and self.absDomain.constantTransfers:
+            fact = self.representative(self.slots[var], bbid)
+            if fact in self.values:
+                self.memoHits += 1
+                return self.decode(self.values[fact])
+            inputs = self.backwardSlice(fact)
+            if inputs is not None:
+                self.solve(inputs)
+                return self.decode(self.values[fact])
+        if self.exhaustive is None:
+            self.exhaustive = AbstractInterpretation(self.ast, self.cfg, self.absDomain)
+            self.exhaustive.run()
+        return self.decode(self.exhaustive.stateMap[bbid][var])
+
+
+if __name__ == '__main__':
+    argParser = argparse.ArgumentParser(description='Answer points-to queries without analyzing the whole program')
+    argParser.add_argument('input_file')
+    argParser.add_argument('queries', nargs='+', metavar='VAR@BBID', help="a variable and a bbid, or 'end'")
+    argParser.add_argument('--domain', choices=sorted(domains), default='sets')
+    argParser.add_argument('--parser', choices=('antlr', 'fast'), default='fast')
+    argParser.add_argument('--fallback-ratio', type=float, default=0.5,
+                           help='run the exhaustive solver once a slice has more facts than this times the nodes')
+    args = argParser.parse_args()
+
+    with open(args.input_file) as f:
+        ast = parseProgram(f.read(), args.parser)
+    cfg = CFG(ast)
+    analysis = DemandAnalysis(ast, cfg, domains[args.domain](cfg), args.fallback_ratio)
+    for spec in args.queries:
+        var, _, where = spec.rpartition('@')
+        bbid = cfg.endNode.bbid if where == 'end' else int(where)
+        print(spec, repr(analysis.query(var, bbid)))
+    print('{} queries, {} facts solved, {} answered from memo{}'.format(
+        analysis.queries, analysis.factsSolved, analysis.memoHits,
+        ', exhaustive solver used' if analysis.exhaustive else ''), file=sys.stderr)
@@ -1,8 +1,20 @@
+import operator
+
+from abstractDomain import AbstractDomain
+from pointersParser import pointersParser
+
+
+# Constant propagation over the integer variables of the extra credit grammar. The lattice is
+# flat (Bot < every constant < Top), so it has finite height and needs no widening. The
+# methods are static, like the methods of PointersDomain. abstractDomain.py is in the
+# repository root, which the entry point (extraCredit/parser.py) puts on sys.path.
 class ConstDomain(AbstractDomain):
+    finiteHeight = True
     topElement = "Top"
     bottomElement = "Bot"
 
     # Returns the least upper bound given two elements
+    @staticmethod
     def lub(a, b):
         if a==ConstDomain.bottomElement:
             return b
@@ -13,18 +25,21 @@ class ConstDomain(AbstractDomain):
         else:
             return ConstDomain.topElement
 
+    @staticmethod
     def isConst(val):
         if val != ConstDomain.topElement and val != ConstDomain.bottomElement:
             return True
         else:
             return False
 
+    @staticmethod
     def isEqual(state1, state2):
         for key in state1.keys():
             if state1[key] != state2[key]:
                 return False
         return True
 
+    @staticmethod
     def handleBinaryExpression(expression, abstractState, opr):
         lhs = ConstDomain.absEvalExpression(expression.expression(0), abstractState)
         rhs = ConstDomain.absEvalExpression(expression.expression(1), abstractState)
@@ -37,6 +52,7 @@ class ConstDomain(AbstractDomain):
             return ConstDomain.topElement
         return (lhs, rhs)
 
+    @staticmethod
     def absEvalExpression(expression, abstractState):
         if isinstance(expression, pointersParser.LiteralContext):
             return int(expression.getText())
@@ -53,6 +69,7 @@ class ConstDomain(AbstractDomain):
         if isinstance(expression, pointersParser.MinusContext):
             return ConstDomain.handleBinaryExpression(expression, abstractState, operator.sub)
 
+    @staticmethod
     def statementTransfer(block, currentState, nextAbstractState):
         if isinstance(block.content, pointersParser.SkipContext):
             return currentState
@@ -70,6 +87,7 @@ class ConstDomain(AbstractDomain):
         else:
             return currentState
 
+    @staticmethod
     def merge(abstractState1, abstractState2):
         newAbstractState = {}
         for key in abstractState1.keys():
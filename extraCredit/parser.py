@@ -1,3 +1,4 @@
+import os
 import sys
 from antlr4 import CommonTokenStream
 from antlr4 import InputStream
@@ -10,6 +11,11 @@ import networkx as nx
 
 import operator
 
+# constDomain.py needs abstractDomain.py from the repository root. The root is searched after
+# this directory, so the extra credit grammar's own pointersParser is the one imported above.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from constDomain import ConstDomain
+
 class CFGNode:
     def __init__(self, *args):
         self.content = args[0]
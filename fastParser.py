@@ -0,0 +1,352 @@
+# Hand-written lexer and parser for the language in pointers.g4.
+#
+# The ANTLR generated parser stays the reference implementation. This module builds the same
+# program structure without the ANTLR runtime: the node classes below expose the parts of the
+# ANTLR context API that CFG and the abstract domains use (getText, variable, cond, ifs, elses,
+# statement). Parsing is table driven and uses an explicit stack of open blocks, so deeply
+# nested programs do not hit the recursion limit.
+#
+# One difference is intentional: the program rule of pointers.g4 has no EOF, so the ANTLR
+# parser stops after the last statement it can parse and silently ignores whatever follows
+# (e.g. 'x := y; ) z := x;' is read as 'x := y;'), even with the error listener of
+# parser.parseProgram(strict=True). This parser reads up to the end of the input and reports
+# trailing text that is not a statement as a ParseError.
+#
+# The lexer and the parser both run on streams: a program can be read from a file in chunks
+# (readChunks) and its top-level statements taken one at a time (Parser.statements), so only
+# the statement being parsed is held in memory, never the whole text or token list.
+import re
+
+# Characters read from a file at a time
+chunkSize = 1 << 20
+
+
+# The arguments are kept as they were given, so the error can be pickled (e.g. to be sent
+# back from a worker process) and rebuilt
+class ParseError(Exception):
+    def __init__(self, message, line, column):
+        Exception.__init__(self, message, line, column)
+        self.message = message
+        self.line = line
+        self.column = column
+
+    def __str__(self):
+        return 'line {}:{} {}'.format(self.line, self.column, self.message)
+
+
+# Lexer rules of pointers.g4. Identifiers are matched first and then turned into keyword
+# tokens if they spell one, which is what ANTLR's longest-match rule does for this grammar.
+keywords = {
+    'skip': 'SKIPSTATEMENT',
+    'newObject': 'ALLOC',
+    'if': 'IF',
+    'then': 'THEN',
+    'else': 'ELSE',
+    'done': 'DONE',
+    'while': 'WHILE',
+    'do': 'DO',
+    'od': 'OD',
+    'null': 'NULL',
+}
+
+tokenPattern = re.compile(r'''
+    (?P<WHITESPACE>[ \t\r\n\f]+)
+  | (?P<VAR>[a-zA-Z][._0-9A-Za-z]*)
+  | (?P<INT>[0-9]+)
+  | (?P<PUNCT>:=|==|[(){};<+\-*/])
+''', re.VERBOSE)
+
+EOF = 'EOF'
+
+
+# Yields (type, text, (line, column)) tuples for the text of a program given in chunks,
+# ending with an EOF token. Punctuation tokens use their text as type. A token that reaches
+# the end of the text read so far may continue in the next chunk, so it is only taken once
+# more text has been read or the input has ended.
+def iterTokens(chunks):
+    match = tokenPattern.match
+    chunks = iter(chunks)
+    buffer = ''
+    # Offset of buffer[0] and of the start of the current line in the whole input
+    offset = 0
+    lineStart = 0
+    line = 1
+    final = False
+    while not final:
+        chunk = next(chunks, None)
+        if chunk is None:
+            final = True
+        else:
+            buffer += chunk
+        pos = 0
+        end = len(buffer)
+        while pos < end:
+            m = match(buffer, pos)
+            if not final and (m.end() == end if m else end - pos < 2):
+                break
+            if m is None:
+                raise ParseError("token recognition error at: '{}'".format(buffer[pos]), line, offset + pos - lineStart)
+            kind = m.lastgroup
+            value = m.group()
+            if kind == 'WHITESPACE':
+                newlines = value.count('\n')
+                if newlines:
+                    line += newlines
+                    lineStart = offset + pos + value.rfind('\n') + 1
+            elif kind == 'VAR':
+                yield (keywords.get(value, 'VAR'), value, (line, offset + pos - lineStart))
+            elif kind == 'PUNCT':
+                yield (value, value, (line, offset + pos - lineStart))
+            else:
+                yield ('INT', value, (line, offset + pos - lineStart))
+            pos = m.end()
+        offset += pos
+        buffer = buffer[pos:]
+    yield (EOF, '<EOF>', (line, offset - lineStart))
+
+
+# Returns a list of (type, text, (line, column)) tuples
+def tokenize(text):
+    return list(iterTokens([text]))
+
+
+def readChunks(f, size=None):
+    while True:
+        chunk = f.read(size or chunkSize)
+        if not chunk:
+            return
+        yield chunk
+
+
+class Variable:
+    kind = 'var'
+
+    def __init__(self, name):
+        self.name = name
+
+    def getText(self):
+        return self.name
+
+
+class NullVariable(Variable):
+    kind = 'null'
+
+
+class Skip:
+    kind = 'skip'
+
+    def getText(self):
+        return 'skip'
+
+
+class Alloc:
+    kind = 'alloc'
+
+    def __init__(self, target, site):
+        self.target = target
+        self.site = site
+
+    def variable(self):
+        return self.target
+
+    def getText(self):
+        return '{}:=newObject{}'.format(self.target.getText(), self.site)
+
+
+class Assign:
+    kind = 'assign'
+
+    def __init__(self, lhs, rhs):
+        self.operands = [lhs, rhs]
+
+    def variable(self, i=None):
+        if i is None:
+            return list(self.operands)
+        return self.operands[i]
+
+    def getText(self):
+        return '{}:={}'.format(self.operands[0].getText(), self.operands[1].getText())
+
+
+# The text ANTLR's getText gives a statement, built with an explicit stack so that deeply
+# nested statements do not hit the recursion limit
+def statementText(statement):
+    pieces = []
+    stack = [statement]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            pieces.append(item)
+        elif item.kind == 'if':
+            parts = ['if(' + item.cond.getText() + ')'] + blockParts(item.ifs)
+            if item.elses:
+                parts += ['else'] + blockParts(item.elses)
+            stack.extend(reversed(parts))
+        elif item.kind == 'while':
+            stack.extend(reversed(['while(' + item.cond.getText() + ')'] + blockParts(item.body)))
+        else:
+            pieces.append(item.getText())
+    return ''.join(pieces)
+
+
+def blockParts(statements):
+    parts = ['{']
+    for statement in statements:
+        parts += [statement, ';']
+    return parts + ['}']
+
+
+# The text of if and while statements is only built when it is asked for: building it for
+# every statement would take time quadratic in the nesting depth
+class If:
+    kind = 'if'
+
+    def __init__(self, cond, ifs, elses):
+        self.cond = cond
+        self.ifs = ifs
+        self.elses = elses
+
+    def getText(self):
+        return statementText(self)
+
+
+class While:
+    kind = 'while'
+
+    def __init__(self, cond, body):
+        self.cond = cond
+        self.body = body
+
+    # Like the ANTLR context every call returns a new list
+    def statement(self):
+        return list(self.body)
+
+    def getText(self):
+        return statementText(self)
+
+
+class Program:
+    kind = 'program'
+
+    def __init__(self, statements, varset):
+        self.statements = statements
+        self.varset = varset
+
+    def statement(self):
+        return list(self.statements)
+
+
+# An open '{ ... }' block (or the whole program) waiting for more statements
+class Frame:
+    def __init__(self, kind, cond):
+        self.kind = kind
+        self.cond = cond
+        self.statements = []
+        self.ifs = None
+
+
+# Parses a stream of tokens (see iterTokens). varset collects the variables of the program.
+class Parser:
+    def __init__(self, tokens):
+        self.tokens = iter(tokens)
+        self.token = next(self.tokens)
+        self.varset = set()
+
+    def peek(self):
+        return self.token[0]
+
+    # Moves to the next token. Never called on EOF: nothing follows the end of the program.
+    def advance(self):
+        token = self.token
+        self.token = next(self.tokens)
+        return token
+
+    def expect(self, kind):
+        if self.token[0] != kind:
+            raise ParseError("mismatched input '{}' expecting '{}'".format(self.token[1], kind), *self.token[2])
+        return self.advance()
+
+    def error(self, expected):
+        raise ParseError("mismatched input '{}' expecting {}".format(self.token[1], expected), *self.token[2])
+
+    def variable(self):
+        kind, value, pos = self.token
+        if kind == 'VAR':
+            self.advance()
+            self.varset.add(value)
+            return Variable(value)
+        if kind == 'NULL':
+            self.advance()
+            return NullVariable(value)
+        self.error('VAR or null')
+
+    # Parses '(' variable ')' '{' and returns the condition
+    def blockHeader(self):
+        self.expect('(')
+        cond = self.variable()
+        self.expect(')')
+        self.expect('{')
+        return cond
+
+    def program(self):
+        statements = list(self.statements())
+        return Program(statements, self.varset)
+
+    # program: (statement ';')+, followed by the end of the input (see the header)
+    # Yields every top-level statement once its ';' has been read. The stack holds the blocks
+    # that are still open. A simple statement is appended to the innermost block, if/while
+    # open a new block and '}' closes one, producing a statement for the enclosing block.
+    def statements(self):
+        stack = [Frame('program', None)]
+        count = 0
+        while True:
+            frame = stack[-1]
+            kind = self.peek()
+            statement = None
+            if kind == 'SKIPSTATEMENT':
+                self.advance()
+                statement = Skip()
+            elif kind == 'VAR' or kind == 'NULL':
+                lhs = self.variable()
+                self.expect(':=')
+                if self.peek() == 'ALLOC':
+                    self.advance()
+                    statement = Alloc(lhs, self.expect('VAR')[1])
+                else:
+                    statement = Assign(lhs, self.variable())
+            elif kind == 'IF' or kind == 'WHILE':
+                self.advance()
+                stack.append(Frame(kind, self.blockHeader()))
+                continue
+            elif kind == '}' and frame.kind != 'program' and frame.statements:
+                self.advance()
+                if frame.kind == 'IF':
+                    if self.peek() == 'ELSE':
+                        self.advance()
+                        self.expect('{')
+                        frame.kind = 'ELSE'
+                        frame.ifs = frame.statements
+                        frame.statements = []
+                        continue
+                    statement = If(frame.cond, frame.statements, [])
+                elif frame.kind == 'ELSE':
+                    statement = If(frame.cond, frame.ifs, frame.statements)
+                else:
+                    statement = While(frame.cond, frame.statements)
+                stack.pop()
+                frame = stack[-1]
+            elif kind == EOF and frame.kind == 'program' and count:
+                return
+            else:
+                self.error('a statement')
+            if frame.kind == 'program':
+                self.expect(';')
+                count += 1
+                yield statement
+                continue
+            frame.statements.append(statement)
+            self.expect(';')
+
+
+def parseProgram(text):
+    return Parser(iterTokens([text])).program()
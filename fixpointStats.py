@@ -0,0 +1,143 @@
+# Opt-in counters for the fixpoint engine, enabled with parser.py --profile.
+#
+# AbstractInterpretation only touches a FixpointStats when it is given one: the domain and
+# the worklist are then wrapped in the counting proxies below. Without profiling the engine
+# runs the unwrapped objects, so the counters cost nothing.
+import collections
+import contextlib
+import json
+import sys
+import time
+
+
+class FixpointStats:
+    def __init__(self):
+        self.visits = collections.Counter()
+        self.transfers = collections.Counter()
+        self.merges = 0
+        self.widenings = 0
+        self.narrowings = 0
+        self.isEqualOutcomes = {True: 0, False: 0}
+        self.worklistHighWater = 0
+        self.phaseTimes = collections.OrderedDict()
+        # Counters reported by the domain itself (see addDomainCounters)
+        self.domainCounters = {}
+
+    # Domains that keep caches (e.g. InternedPointersDomain) report them through cacheStats()
+    def addDomainCounters(self, domain):
+        cacheStats = getattr(domain, 'cacheStats', None)
+        if cacheStats:
+            self.domainCounters.update(cacheStats())
+
+    def wrapDomain(self, domain):
+        return CountingDomain(domain, self)
+
+    def wrapWorklist(self, worklist):
+        return CountingWorklist(worklist, self)
+
+    @contextlib.contextmanager
+    def timer(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phaseTimes[phase] = self.phaseTimes.get(phase, 0.0) + time.perf_counter() - start
+
+    def toJSON(self):
+        return {
+            'phaseTimes': self.phaseTimes,
+            'visits': {str(bbid): count for bbid, count in sorted(self.visits.items())},
+            'transfers': {str(bbid): count for bbid, count in sorted(self.transfers.items())},
+            'transferCalls': sum(self.transfers.values()),
+            'mergeCalls': self.merges,
+            'widenCalls': self.widenings,
+            'narrowCalls': self.narrowings,
+            'isEqual': {'equal': self.isEqualOutcomes[True], 'different': self.isEqualOutcomes[False]},
+            'worklistHighWater': self.worklistHighWater,
+            'domain': self.domainCounters,
+        }
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.toJSON(), f, indent=1)
+
+    # Ranked report of the nodes the engine processed most often
+    def report(self, cfg, top=10, out=sys.stderr):
+        print('--- fixpoint profile ---', file=out)
+        print('phases: ' + '  '.join('{} {:.4f}s'.format(phase, seconds) for phase, seconds in self.phaseTimes.items()), file=out)
+        print('transfers {}  merges {}  widen {}  narrow {}  isEqual equal {} different {}  worklist high-water {}'.format(
+            sum(self.transfers.values()), self.merges, self.widenings, self.narrowings,
+            self.isEqualOutcomes[True], self.isEqualOutcomes[False], self.worklistHighWater), file=out)
+        if self.domainCounters:
+            print('domain: ' + '  '.join('{} {}'.format(name, value) for name, value in self.domainCounters.items()), file=out)
+        totalVisits = sum(self.visits.values())
+        print('{} visits to {} of {} nodes, hottest first:'.format(totalVisits, len(self.visits), cfg.maxBBId + 1), file=out)
+        print('{:>8} {:>7} {:>10} {:>6}  node'.format('visits', 'share', 'transfers', 'bbid'), file=out)
+        for bbid, count in sorted(self.visits.items(), key=lambda item: (-item[1], item[0]))[:top]:
+            node = cfg.nodes[bbid]
+            share = 100.0 * count / totalVisits
+            print('{:>8} {:>6.1f}% {:>10} {:>6}  {}'.format(count, share, self.transfers[bbid], bbid, node.text), file=out)
+
+
+# Forwards everything to the wrapped domain and counts the calls made by the engine.
+# Transfers are counted per target block.
+class CountingDomain:
+    def __init__(self, domain, stats):
+        self.domain = domain
+        self.stats = stats
+
+    # widen and narrow are optional, so they are only counted if the domain has them
+    def __getattr__(self, name):
+        attr = getattr(self.domain, name)
+        if name == 'widen' or name == 'narrow':
+            counter = 'widenings' if name == 'widen' else 'narrowings'
+
+            def counted(abstractState1, abstractState2):
+                setattr(self.stats, counter, getattr(self.stats, counter) + 1)
+                return attr(abstractState1, abstractState2)
+            return counted
+        return attr
+
+    def statementTransfer(self, block, currentState, nextAbstractState):
+        self.stats.transfers[block.bbid] += 1
+        return self.domain.statementTransfer(block, currentState, nextAbstractState)
+
+    def merge(self, abstractState1, abstractState2):
+        self.stats.merges += 1
+        return self.domain.merge(abstractState1, abstractState2)
+
+    # Batched operations count as the calls they replace
+    def mergeMany(self, states):
+        self.stats.merges += len(states) - 1
+        return self.domain.mergeMany(states)
+
+    def transferBlock(self, nodes, currentState):
+        for node in nodes:
+            self.stats.transfers[node.bbid] += 1
+        return self.domain.transferBlock(nodes, currentState)
+
+    def isEqual(self, state1, state2):
+        res = self.domain.isEqual(state1, state2)
+        self.stats.isEqualOutcomes[bool(res)] += 1
+        return res
+
+
+# Wraps the engine's worklist to count how often every node is taken off it and how many
+# nodes were waiting at most
+class CountingWorklist:
+    def __init__(self, worklist, stats):
+        self.worklist = worklist
+        self.stats = stats
+
+    def push(self, node):
+        self.worklist.push(node)
+        if len(self.worklist) > self.stats.worklistHighWater:
+            self.stats.worklistHighWater = len(self.worklist)
+
+    def pop(self):
+        node = self.worklist.pop()
+        self.stats.visits[node.bbid] += 1
+        return node
+
+    def __len__(self):
+        return len(self.worklist)
@@ -0,0 +1,225 @@
+# Incremental re-analysis of a program that is edited repeatedly (e.g. from an editor).
+#
+# A node of the new version is affected if it is changed or reachable from a changed node,
+# and starts again from bottom. All other nodes can only be reached through unaffected
+# nodes, so their states are exactly those of the previous fixpoint and are reused. The
+# worklist is seeded with the affected nodes and their unaffected predecessors, which gives
+# the same states as analyzing the new version from scratch.
+#
+# With the fast parser only the edited top-level statements are parsed again. The text the
+# new version shares with the previous one at its start and at its end is found first; the
+# top-level statements that lie entirely in it are kept, and only the text between them is
+# parsed. Top-level statements do not depend on each other, so this gives the same tree as
+# parsing the whole file, and if that text is not a sequence of statements the whole file is
+# parsed (and the error reported from there). Every statement keeps the fragment of the CFG
+# built for it (see CFG.fromFragments): the statements before the edit keep their nodes and
+# bbids, so they are the unaffected nodes, and the statements after it are only numbered
+# anew. The analysis takes over the KeyIndex of the previous one, so only new and renumbered
+# nodes are lowered.
+#
+# With the ANTLR parser the CFG of the new version is built from scratch and compared node by
+# node with the previous one: a node is changed if it is new or its kind, text or successors
+# differ.
+#
+#   python3 incremental.py old.c new.c      analyzes old.c, then new.c incrementally
+import argparse
+import re
+import sys
+import time
+
+import fastParser
+from parser import AbstractInterpretation, CFG, domains, parseProgram, programVariables
+
+
+# Slices are compared instead of characters, so that the comparisons run at C speed
+def commonPrefixLength(a, b):
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def commonSuffixLength(a, b, limit):
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[len(a) - mid:] == b[len(b) - mid:]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+# Returns a (start, end, statement, variables) tuple for every top-level statement of text.
+# A statement spans from its first token to the first token of the next one (or the end of
+# text), and offsets are counted from base.
+def parseStatements(text, base=0):
+    lineStarts = [0] + [m.end() for m in re.finditer('\n', text)]
+    parser = fastParser.Parser(fastParser.iterTokens([text]))
+    records = []
+    start = lineStarts[parser.token[2][0] - 1] + parser.token[2][1]
+    for statement in parser.statements():
+        line, column = parser.token[2]
+        end = lineStarts[line - 1] + column
+        records.append((base + start, base + end, statement, parser.varset))
+        parser.varset = set()
+        start = end
+    return records
+
+
+def nodeSignature(cfg, bbid):
+    node = cfg.nodes[bbid]
+    return (node.kind, node.text, cfg.succs[bbid])
+
+
+# Nodes of cfg whose state may differ from the state of the same bbid in previousCfg
+def affectedNodes(previousCfg, cfg):
+    stack = []
+    for bbid in range(len(cfg.nodes)):
+        if bbid >= len(previousCfg.nodes) or nodeSignature(previousCfg, bbid) != nodeSignature(cfg, bbid):
+            stack.append(bbid)
+    affected = set(stack)
+    while stack:
+        bbid = stack.pop()
+        for nextBbid in cfg.succs[bbid]:
+            if nextBbid not in affected:
+                affected.add(nextBbid)
+                stack.append(nextBbid)
+    return affected
+
+
+class IncrementalAnalysis:
+    def __init__(self, domainName='sets', parserName='fast', order='fifo'):
+        self.domainName = domainName
+        self.parserName = parserName
+        self.order = order
+        self.previous = None
+        self.domain = None
+        # The text of the last version and its top-level statements (see parseStatements),
+        # each with the fragment of the CFG built for it
+        self.source = None
+        self.records = None
+        # Number of nodes whose state was reused by the last update
+        self.reused = 0
+
+    # Domains with an interning table (BitVectorPointersDomain) are extended instead of being
+    # rebuilt, so that the values of reused states keep their meaning
+    def makeDomain(self, cfg):
+        if self.domain is not None and hasattr(self.domain, 'addSites'):
+            self.domain.addSites(cfg)
+        else:
+            self.domain = domains[self.domainName](cfg)
+        return self.domain
+
+    # Parses the new version with the fast parser, reusing the top-level statements it shares
+    # with the last one. Returns its records and the number of nodes at the start of the CFG
+    # that are those of the last version, numbered the same.
+    def parse(self, program_str):
+        head, body, tail = [], None, []
+        if self.records is not None:
+            source = self.source
+            prefix = commonPrefixLength(source, program_str)
+            suffix = commonSuffixLength(source, program_str, min(len(source), len(program_str)) - prefix)
+            shift = len(program_str) - len(source)
+            head = [record for record in self.records if record[1] <= prefix]
+            tail = [(start + shift, end + shift, statement, variables, nodes)
+                    for start, end, statement, variables, nodes in self.records if start >= len(source) - suffix]
+            middleStart = head[-1][1] if head else 0
+            middleEnd = tail[0][0] if tail else len(program_str)
+            middle = program_str[middleStart:middleEnd]
+            try:
+                body = parseStatements(middle, middleStart) if middle.strip() else []
+            except fastParser.ParseError:
+                pass
+            if not (head or body or tail):
+                body = None
+        if body is None:
+            head, body, tail = [], parseStatements(program_str), []
+            kept = 0
+        else:
+            kept = 1
+            for record in head:
+                if record[4]:
+                    kept = record[4][-1].bbid + 1
+        body = [record + (CFG.fragment(record[2]),) for record in body]
+        return head + body + tail, kept
+
+    # Analyzes the new version of the program and returns its AbstractInterpretation
+    def update(self, program_str):
+        previous = self.previous
+        if self.parserName == 'fast':
+            records, kept = self.parse(program_str)
+            ast = fastParser.Program([record[2] for record in records], set().union(*(record[3] for record in records)))
+            cfg = CFG.fromFragments([record[4] for record in records], previous.cfg if kept else None, kept)
+        else:
+            records, kept = None, 0
+            ast = parseProgram(program_str, self.parserName)
+            cfg = CFG(ast)
+        domain = self.makeDomain(cfg)
+        self.reused = 0
+        # Widening depends on the order in which nodes are visited, so domains that widen
+        # are always analyzed from scratch. So are domains with their own state
+        # representation, which number the allocation sites anew for every version.
+        if (previous is None or domain.supportsWidening or hasattr(domain, 'initialState') or
+                sorted(programVariables(ast)) != previous.bottomState.keys()):
+            absInterp = AbstractInterpretation(ast, cfg, domain, self.order)
+            absInterp.run()
+        else:
+            if kept:
+                affected = range(kept, cfg.maxBBId + 1)
+                unaffected = range(kept)
+            else:
+                affected = affectedNodes(previous.cfg, cfg)
+                unaffected = set(range(cfg.maxBBId + 1)) - affected
+            absInterp = AbstractInterpretation(ast, cfg, domain, self.order, previous=previous, reused=unaffected)
+            # The states that were not taken over are freed before the new ones are computed,
+            # so the garbage collector does not scan them during the run
+            self.previous = previous = None
+            seeds = set(affected)
+            for bbid in affected:
+                seeds.update(pred for pred in cfg.preds[bbid] if pred in unaffected)
+            absInterp.run([cfg.nodes[bbid] for bbid in sorted(seeds)])
+            self.reused = len(unaffected)
+        self.previous = absInterp
+        self.source = program_str
+        self.records = records
+        return absInterp
+
+
+if __name__ == '__main__':
+    argParser = argparse.ArgumentParser(description='Analyze successive versions of a program incrementally')
+    argParser.add_argument('versions', nargs='+', help='versions of the program, oldest first')
+    argParser.add_argument('--domain', choices=sorted(domains), default='sets')
+    argParser.add_argument('--parser', choices=('antlr', 'fast'), default='fast')
+    argParser.add_argument('--check', action='store_true',
+                           help='also analyze every version from scratch and fail if the states differ')
+    args = argParser.parse_args()
+
+    analysis = IncrementalAnalysis(args.domain, args.parser)
+    for path in args.versions:
+        with open(path) as f:
+            program_str = f.read()
+        start = time.perf_counter()
+        absInterp = analysis.update(program_str)
+        elapsed = time.perf_counter() - start
+        print('{}: {:.4f}s, reused {} of {} states'.format(path, elapsed, analysis.reused, absInterp.cfg.maxBBId + 1),
+              file=sys.stderr)
+        if args.check:
+            ast = parseProgram(program_str, args.parser)
+            cfg = CFG(ast)
+            scratch = AbstractInterpretation(ast, cfg, domains[args.domain](cfg))
+            scratch.run()
+            for bbid in scratch.stateMap:
+                if scratch.getAbsState(bbid) != absInterp.getAbsState(bbid):
+                    print('{}: state of {} differs from a full analysis'.format(path, bbid), file=sys.stderr)
+                    sys.exit(1)
+
+    print('--------------')
+    CFG.printCFG(absInterp.cfg.startNode, 0)
+    print('--------------')
+    absInterp.printAbsState()
+    print('--------------')
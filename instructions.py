@@ -0,0 +1,8 @@
+# Opcodes of the statements as seen by the domains. CFG.lower turns the statement of every
+# node into an (opcode, dst, src) tuple whose variables are slots of the states' KeyIndex:
+#   (ALLOC, dst, site)   dst := newObject, site is the bbid of the node
+#   (COPY, dst, src)     dst := src
+#   (NULL, dst, None)    dst := null
+#   (NOP, None, None)    everything else (skip, split, join and exit nodes, ...)
+ALLOC, COPY, NULL, NOP = range(4)
+NOP_INSTR = (NOP, None, None)
@@ -0,0 +1,143 @@
+# Pointer analysis with whole states stored as NumPy boolean matrices.
+#
+# A state is a matrix with one row per variable (in the slot order of the KeyIndex) and one
+# column per allocation site, plus column 0 for 'null'. merge is one vectorized or over the
+# whole matrix, isEqual one array comparison and the transfer functions are row operations.
+# mergeMany ors the matrices of all states at once and transferBlock writes the rows of a
+# whole block into a single copy of the matrix.
+# With packed=True every row is stored with np.packbits, eight columns per byte, which cuts
+# the memory of a state by eight at the price of packing the rows written by a transfer.
+#
+# States are never modified once they are built: a transfer copies the matrix before
+# writing a row, and copy() shares it. This is the representation to use for programs with
+# thousands of variables and allocation sites, see benchmark.py --suite wide.
+import numpy as np
+
+from abstractDomain import AbstractDomain
+from instructions import ALLOC, COPY, NULL, NOP
+
+
+class MatrixState:
+    __slots__ = ('index', 'matrix')
+
+    def __init__(self, index, matrix):
+        self.index = index
+        self.matrix = matrix
+
+    def copy(self):
+        return MatrixState(self.index, self.matrix)
+
+    def getSlot(self, slot):
+        return self.matrix[slot]
+
+    # (key, row) pairs of the rows that differ from the rows of other
+    def diff(self, other):
+        if self.matrix is other.matrix:
+            return []
+        changed = np.flatnonzero((self.matrix != other.matrix).any(axis=1))
+        return [(self.index.keys[slot], self.matrix[slot]) for slot in changed]
+
+    def __getitem__(self, key):
+        return self.matrix[self.index.slots[key]]
+
+    def __contains__(self, key):
+        return key in self.index.slots
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        return iter(self.index.keys)
+
+    def keys(self):
+        return list(self.index.keys)
+
+    def items(self):
+        return [(key, self.matrix[slot]) for slot, key in enumerate(self.index.keys)]
+
+    def __eq__(self, other):
+        return isinstance(other, MatrixState) and np.array_equal(self.matrix, other.matrix)
+
+    __hash__ = None
+
+
+class MatrixPointersDomain(AbstractDomain):
+    finiteHeight = True
+    constantTransfers = True
+
+    def __init__(self, cfg, packed=False):
+        self.packed = packed
+        self.sites = ['null'] + [node.bbid for node in cfg.nodes if node.kind == 'alloc']
+        self.siteColumns = {site: column for column, site in enumerate(self.sites) if column}
+        self.topElement = self.encodeRow([0])
+        self.bottomElement = self.encodeRow([])
+
+    # The row holding exactly the given columns
+    def encodeRow(self, columns):
+        row = np.zeros(len(self.sites), dtype=bool)
+        row[columns] = True
+        return np.packbits(row) if self.packed else row
+
+    def initialState(self, index):
+        return MatrixState(index, np.tile(self.bottomElement, (len(index), 1)))
+
+    # Rows whose 'null' column is set
+    def nullRows(self, matrix):
+        if self.packed:
+            return (matrix[:, 0] & 0x80).astype(bool)
+        return matrix[:, 0]
+
+    # 'null' is absorbing, so any union containing it collapses to the top element
+    def lub(self, a, b):
+        joined = a | b
+        if self.nullRows(joined[np.newaxis]).any():
+            return self.topElement
+        return joined
+
+    def isEqual(self, state1, state2):
+        return state1.matrix is state2.matrix or np.array_equal(state1.matrix, state2.matrix)
+
+    def statementTransfer(self, block, currentState, nextAbstractState):
+        if block.instr[0] == NOP:
+            return currentState
+        matrix = currentState.matrix.copy()
+        self.writeRow(matrix, block.instr)
+        return MatrixState(currentState.index, matrix)
+
+    def transferBlock(self, nodes, currentState):
+        instrs = [node.instr for node in nodes if node.instr[0] != NOP]
+        if not instrs:
+            return currentState
+        matrix = currentState.matrix.copy()
+        for instr in instrs:
+            self.writeRow(matrix, instr)
+        return MatrixState(currentState.index, matrix)
+
+    # Executes one lowered statement on matrix in place
+    def writeRow(self, matrix, instr):
+        op, dst, src = instr
+        if op == COPY:
+            matrix[dst] = matrix[src]
+        elif op == NULL:
+            matrix[dst] = self.topElement
+        elif op == ALLOC:
+            matrix[dst] = self.encodeRow([self.siteColumns[src]])
+
+    def merge(self, abstractState1, abstractState2):
+        return self.withTopRows(abstractState1.index, abstractState1.matrix | abstractState2.matrix)
+
+    def mergeMany(self, states):
+        return self.withTopRows(states[0].index, np.bitwise_or.reduce([state.matrix for state in states]))
+
+    # The state of a merged matrix, with the rows that contain 'null' set to the top element
+    def withTopRows(self, index, matrix):
+        nullRows = self.nullRows(matrix)
+        if nullRows.any():
+            matrix[nullRows] = self.topElement
+        return MatrixState(index, matrix)
+
+    # Turns a row back into the set of allocation sites used by PointersDomain
+    def decode(self, row):
+        if self.packed:
+            row = np.unpackbits(row, count=len(self.sites))
+        return set(self.sites[column] for column in np.flatnonzero(row))
@@ -0,0 +1,257 @@
+# Parallel solver for the analysis of AbstractInterpretation: independent regions of the CFG
+# are solved at the same time by a pool of worker processes.
+#
+# The CFG is split into its strongly connected components (a loop with everything nested in
+# it is one component), and the components into regions: chains of components in which every
+# component but the first has a single predecessor component, whose only successor it is.
+# Every region has a single entry and the regions form a DAG. The two arms of an if are two
+# regions, the nodes before the if and from its join node on are others, and a loop belongs
+# to the region of the statement before it. A region is solved once the regions it depends on
+# are solved, by the worklist iteration of the dense solver restricted to its nodes and fed
+# with the states of its predecessors outside the region. Regions ready at the same time run
+# in parallel, and regions with fewer than grain nodes are solved in this process, where they
+# cost less than the round trip to a worker.
+#
+# The result is exactly that of AbstractInterpretation. The solver only accepts domains of
+# finite height without widening: for those every iteration order reaches the least fixpoint,
+# and the states of a region depend only on the states flowing into it, not on when or in
+# which process it is solved.
+#
+#   python3 parser.py --parallel 8 program.c
+import multiprocessing
+import os
+import queue
+
+from parser import AbstractInterpretation, CFG, Worklist, programVariables
+from persistentMap import KeyIndex, PersistentMap
+from productDomain import ProductDomain
+
+
+# Strongly connected components of the CFG, found with Tarjan's algorithm and an explicit
+# stack. Returns the component of every node and the number of components. Components are
+# numbered in topological order: every edge between two components goes to a higher number.
+def components(cfg):
+    size = len(cfg.nodes)
+    succs = cfg.succs
+    order = [None] * size
+    lowlink = [0] * size
+    onStack = [False] * size
+    stack = []
+    found = []
+    counter = 0
+    for root in range(size):
+        if order[root] is not None:
+            continue
+        order[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        onStack[root] = True
+        work = [(root, iter(succs[root]))]
+        while work:
+            bbid, children = work[-1]
+            for child in children:
+                if order[child] is None:
+                    order[child] = lowlink[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    onStack[child] = True
+                    work.append((child, iter(succs[child])))
+                    break
+                if onStack[child]:
+                    lowlink[bbid] = min(lowlink[bbid], order[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[bbid])
+                if lowlink[bbid] == order[bbid]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        onStack[member] = False
+                        component.append(member)
+                        if member == bbid:
+                            break
+                    found.append(component)
+    # Tarjan's algorithm finds a component after every component it reaches
+    componentOf = [None] * size
+    for number, component in enumerate(reversed(found)):
+        for bbid in component:
+            componentOf[bbid] = number
+    return componentOf, len(found)
+
+
+# The regions of the CFG as lists of bbids in reverse postorder. Regions are numbered in
+# topological order.
+def regions(cfg):
+    componentOf, count = components(cfg)
+    predComponents = [set() for i in range(count)]
+    succComponents = [set() for i in range(count)]
+    for bbid, successors in enumerate(cfg.succs):
+        for child in successors:
+            if componentOf[child] != componentOf[bbid]:
+                succComponents[componentOf[bbid]].add(componentOf[child])
+                predComponents[componentOf[child]].add(componentOf[bbid])
+    regionOf = [None] * count
+    regionCount = 0
+    for component in range(count):
+        if len(predComponents[component]) == 1:
+            pred = next(iter(predComponents[component]))
+            if len(succComponents[pred]) == 1:
+                regionOf[component] = regionOf[pred]
+                continue
+        regionOf[component] = regionCount
+        regionCount += 1
+    res = [[] for i in range(regionCount)]
+    for node in cfg.reversePostorder():
+        res[regionOf[componentOf[node.bbid]]].append(node.bbid)
+    return res
+
+
+# The bottom state over the variables of a program, as AbstractInterpretation.makeBottomState
+# builds it
+def makeBottomState(absDomain, variables):
+    index = KeyIndex(variables)
+    initialState = getattr(absDomain, 'initialState', None)
+    if initialState:
+        return initialState(index)
+    return PersistentMap.fromIndex(index, absDomain.bottomElement)
+
+
+# Solves regions of one CFG, in this process or in a worker
+class RegionSolver:
+    def __init__(self, cfg, absDomain, bottomState):
+        self.cfg = cfg
+        self.absDomain = absDomain
+        self.bottomState = bottomState
+        cfg.lower(bottomState.index)
+        self.position = [0] * len(cfg.nodes)
+        for position, node in enumerate(cfg.reversePostorder()):
+            self.position[node.bbid] = position
+
+    # Pushes myState into the state of node nextBbid like AbstractInterpretation.runHelper and
+    # returns whether the state changed
+    def propagate(self, states, nextBbid, myState):
+        oldState = states[nextBbid]
+        newState = self.absDomain.statementTransfer(self.cfg.nodes[nextBbid], myState, oldState)
+        if self.absDomain.isEqual(oldState, newState):
+            return False
+        mergedState = self.absDomain.merge(oldState, newState)
+        if self.absDomain.isEqual(oldState, mergedState):
+            return False
+        states[nextBbid] = mergedState
+        return True
+
+    # Returns the states of the nodes of region (in the same order), given the states of the
+    # nodes outside the region that have an edge into it, a dict by bbid
+    def solve(self, region, inputs):
+        nodes = self.cfg.nodes
+        succs = self.cfg.succs
+        states = {bbid: self.bottomState.copy() for bbid in region}
+        worklist = Worklist(self.position)
+        for bbid in region:
+            for pred in self.cfg.preds[bbid]:
+                if pred in inputs:
+                    self.propagate(states, bbid, inputs[pred])
+            worklist.push(nodes[bbid])
+        while worklist:
+            node = worklist.pop()
+            for nextBbid in succs[node.bbid]:
+                if nextBbid in states and self.propagate(states, nextBbid, states[node.bbid]):
+                    worklist.push(nodes[nextBbid])
+        return [states[bbid] for bbid in region]
+
+
+# The RegionSolver of a worker process. Forked workers are handed the solver of the parent,
+# which they inherit without pickling; other workers build one from the serialized CFG.
+workerSolver = None
+
+
+def useSolver(solver):
+    global workerSolver
+    workerSolver = solver
+
+
+def initWorker(entries, variables, absDomain):
+    useSolver(RegionSolver(CFG.deserialize(entries), absDomain, makeBottomState(absDomain, variables)))
+
+
+def solveRegion(region, preds, states):
+    states = workerSolver.absDomain.importStates(states, workerSolver.bottomState.index)
+    return workerSolver.solve(region, dict(zip(preds, states)))
+
+
+class ParallelInterpretation(AbstractInterpretation):
+    def __init__(self, ast, cfg, absDomain, workers=None, grain=256):
+        if isinstance(absDomain, tuple):
+            absDomain = ProductDomain(absDomain)
+        if not absDomain.finiteHeight or absDomain.supportsWidening:
+            raise ValueError('The parallel solver needs a domain of finite height without widening')
+        self.ast = ast
+        self.cfg = cfg
+        self.absDomain = absDomain
+        self.workers = workers or os.cpu_count()
+        self.grain = grain
+        self.stateMap = self.getInitialStateMap()
+        self.regions = regions(cfg)
+        self.solver = RegionSolver(cfg, absDomain, self.bottomState)
+
+    def run(self):
+        regionOf = [None] * len(self.cfg.nodes)
+        for number, region in enumerate(self.regions):
+            for bbid in region:
+                regionOf[bbid] = number
+        # The nodes outside a region with an edge into it, and the regions waiting for a region
+        self.inputs = []
+        self.dependents = [[] for region in self.regions]
+        self.waiting = []
+        for number, region in enumerate(self.regions):
+            preds = sorted(set(pred for bbid in region for pred in self.cfg.preds[bbid] if regionOf[pred] != number))
+            sources = set(regionOf[pred] for pred in preds)
+            for source in sources:
+                self.dependents[source].append(number)
+            self.inputs.append(preds)
+            self.waiting.append(len(sources))
+        large = sum(len(region) >= self.grain for region in self.regions)
+        if self.workers > 1 and large > 1:
+            if multiprocessing.get_start_method() == 'fork':
+                initializer, initargs = useSolver, (self.solver,)
+            else:
+                initializer, initargs = initWorker, (self.cfg.serialize(), sorted(programVariables(self.ast)), self.absDomain)
+            with multiprocessing.Pool(min(self.workers, large), initializer=initializer, initargs=initargs) as pool:
+                self.schedule(pool)
+        else:
+            self.schedule(None)
+
+    # Solves every region once the regions it depends on are solved. Large regions go to the
+    # pool, the others are solved right away.
+    def schedule(self, pool):
+        ready = [number for number, count in enumerate(self.waiting) if count == 0]
+        finished = queue.Queue()
+        running = 0
+        while ready or running:
+            while ready:
+                number = ready.pop()
+                region = self.regions[number]
+                states = [self.stateMap[pred] for pred in self.inputs[number]]
+                if pool is None or len(region) < self.grain:
+                    self.finish(number, self.solver.solve(region, dict(zip(self.inputs[number], states))), ready)
+                    continue
+                pool.apply_async(solveRegion, (region, self.inputs[number], states),
+                                 callback=lambda states, number=number: finished.put((number, states, None)),
+                                 error_callback=lambda error: finished.put((None, None, error)))
+                running += 1
+            if running:
+                number, states, error = finished.get()
+                if error is not None:
+                    raise error
+                running -= 1
+                self.finish(number, self.absDomain.importStates(states, self.bottomState.index), ready)
+
+    def finish(self, number, states, ready):
+        for bbid, state in zip(self.regions[number], states):
+            self.stateMap[bbid] = state
+        for dependent in self.dependents[number]:
+            self.waiting[dependent] -= 1
+            if self.waiting[dependent] == 0:
+                ready.append(dependent)
@@ -6,17 +6,45 @@ from pointersParser import pointersParser
 from pointersVisitor import pointersVisitor
 from pointersListener import pointersListener
 from antlr4 import ParseTreeWalker
-import networkx as nx
+from antlr4.error.ErrorListener import ErrorListener
+from persistentMap import BRANCH_BITS, KeyIndex, PersistentMap
+from instructions import ALLOC, COPY, NULL, NOP, NOP_INSTR
+import fastParser
+from fixpointStats import FixpointStats
+from abstractDomain import AbstractDomain
+from productDomain import ProductDomain
+from cfgCache import CFGCache
+import cfgExport
+import resultWriter
 
+import argparse
+import collections
+import contextlib
+import heapq
+import itertools
 import operator
 
+# kind is one of 'start', 'end', 'if', 'while', 'join', 'exit' (the node after a loop)
+# or the statementKind of the statement in content
 class CFGNode:
+    __slots__ = ('content', 'text', 'isSplit', 'bbid', 'kind', 'nextblock', 'trueCase', 'falseCase', 'isLoopHead',
+                 'instr', 'loweredFor')
+
     def __init__(self, *args):
         self.content = args[0]
         self.text = args[1]
         self.isSplit = args[2]
         self.bbid = args[3]
+        self.kind = args[4]
         self.nextblock = None
+        self.trueCase = None
+        self.falseCase = None
+        # Set on the split node of a while loop, the target of the loop's back edge
+        self.isLoopHead = False
+        # The statement lowered by CFG.lower, an (opcode, dst, src) tuple, and the KeyIndex it
+        # was lowered for
+        self.instr = NOP_INSTR
+        self.loweredFor = None
 
     def setNextBlock(self, nextblock):
         self.nextblock = nextblock
@@ -26,182 +54,1018 @@ class CFGNode:
         self.falseCase = falseCase
 
 
+# Kinds of the parse tree nodes the CFG and the domains look at. Nodes built by fastParser
+# carry their kind as an attribute, the ANTLR contexts are looked up by class.
+contextKinds = {
+    pointersParser.SkipContext: 'skip',
+    pointersParser.AllocContext: 'alloc',
+    pointersParser.AssignContext: 'assign',
+    pointersParser.IfContext: 'if',
+    pointersParser.WhileContext: 'while',
+    pointersParser.VariableNameContext: 'var',
+    pointersParser.NullvarContext: 'null',
+}
+
+def statementKind(ctx):
+    kind = contextKinds.get(type(ctx))
+    if kind is None:
+        kind = getattr(ctx, 'kind', None)
+    return kind
+
+
+# The instruction of a node (see instructions.py), with variables turned into slots
+def lowerStatement(node, slots):
+    kind = node.kind
+    content = node.content
+    if kind == 'alloc':
+        return (ALLOC, slots[content.variable().getText()], node.bbid)
+    if kind == 'assign':
+        dst = slots[content.variable(0).getText()]
+        if statementKind(content.variable(1)) == 'null':
+            return (NULL, dst, None)
+        return (COPY, dst, slots[content.variable(1).getText()])
+    return NOP_INSTR
+
+
+# Turns the syntax errors ANTLR reports into a fastParser.ParseError instead of printing them
+# and recovering
+class SyntaxErrorListener(ErrorListener):
+    def syntaxError(self, recognizer, offendingSymbol, line, column, msg, e):
+        raise fastParser.ParseError(msg, line, column)
+
+
+# Counts the syntax errors ANTLR recovers from, next to the listener that prints them
+class SyntaxErrorCounter(ErrorListener):
+    def __init__(self):
+        self.count = 0
+
+    def syntaxError(self, recognizer, offendingSymbol, line, column, msg, e):
+        self.count += 1
+
+
+# Parses a program with the ANTLR generated parser (the reference) or with fastParser. The
+# ANTLR parser reports syntax errors on stderr and goes on with what it could recover, or with
+# strict raises a ParseError like fastParser does. A recovered tree has the number of errors
+# in syntaxErrors.
+def parseProgram(program_str, parserName='antlr', strict=False):
+    if parserName == 'fast':
+        return fastParser.parseProgram(program_str)
+    input_stream = InputStream(program_str)
+    lexer = pointersLexer(input_stream)
+    stream = CommonTokenStream(lexer)
+    parser = pointersParser(stream)
+    counter = SyntaxErrorCounter()
+    for recognizer in (lexer, parser):
+        if strict:
+            recognizer.removeErrorListeners()
+            recognizer.addErrorListener(SyntaxErrorListener())
+        else:
+            recognizer.addErrorListener(counter)
+    tree = parser.program()
+    tree.syntaxErrors = counter.count
+    return tree
+
+
 class getVarSet(pointersListener):
-    varset = set([])
+    def __init__(self):
+        self.varset = set([])
+
     def enterVariableName(self, ctx):
         self.varset.add(ctx.getText())
 
 
+# Variables of a program. fastParser collects them while parsing, ANTLR trees are walked.
+def programVariables(ast):
+    if hasattr(ast, 'varset'):
+        return ast.varset
+    variableExplorer = getVarSet()
+    walker = ParseTreeWalker()
+    walker.walk(variableExplorer, ast)
+    return variableExplorer.varset
+
+
+# Returns the parse tree and the CFG of a program. With a cfgCache.CFGCache the CFG is
+# loaded from the cache if possible, and the returned tree is then a fastParser.Program
+# that only carries the program's variables. strict is passed on to parseProgram. The CFG of
+# a tree ANTLR recovered from syntax errors is not stored, so a later strict load of the same
+# program parses it again and fails.
+def loadProgram(program_str, parserName='antlr', cache=None, strict=False):
+    if cache:
+        entry = cache.load(program_str, parserName, strict)
+        if entry is not None:
+            return fastParser.Program([], set(entry['variables'])), CFG.deserialize(entry['nodes'])
+    ast = parseProgram(program_str, parserName, strict)
+    cfg = CFG(ast)
+    if cache and not getattr(ast, 'syntaxErrors', 0):
+        cache.store(program_str, parserName, strict, {'variables': sorted(programVariables(ast)), 'nodes': cfg.serialize()})
+    return ast, cfg
+
+
+# Reads a program from a file in chunks and builds its CFG one top-level statement at a time,
+# so the whole text, token list and parse tree are never held in memory at once. Only
+# fastParser can stream: the ANTLR runtime needs the whole input in an InputStream. The
+# returned tree is a fastParser.Program that only carries the program's variables.
+def streamProgram(f, chunkSize=None):
+    parser = fastParser.Parser(fastParser.iterTokens(fastParser.readChunks(f, chunkSize)))
+    cfg = CFG.fromStatements(parser.statements())
+    return fastParser.Program([], parser.varset), cfg
+
+
+# Parses a program with both parsers and describes every difference between the two CFGs. A
+# program only one of them accepts is a difference too: ANTLR recovers from syntax errors and
+# ignores text after the last statement (see fastParser.py), where fastParser fails.
+def compareParsers(program_str):
+    results = []
+    for parserName in ('antlr', 'fast'):
+        try:
+            ast = parseProgram(program_str, parserName)
+        except fastParser.ParseError as e:
+            results.append((None, str(e)))
+            continue
+        errors = getattr(ast, 'syntaxErrors', 0)
+        results.append((ast, 'ok, recovered from syntax errors ({})'.format(errors) if errors else 'ok'))
+    (antlrAst, antlrResult), (fastAst, fastResult) = results
+    if antlrAst is None or fastAst is None or antlrResult != fastResult:
+        return ['antlr: {} fast: {}'.format(antlrResult, fastResult)]
+    mismatches = []
+    antlrVariables = set(programVariables(antlrAst))
+    if antlrVariables != fastAst.varset:
+        mismatches.append('antlr: variables {} fast: variables {}'.format(sorted(antlrVariables), sorted(fastAst.varset)))
+    for antlrNode, fastNode in itertools.zip_longest(CFG(antlrAst).describe(), CFG(fastAst).describe()):
+        if antlrNode != fastNode:
+            mismatches.append('antlr: {} fast: {}'.format(antlrNode, fastNode))
+    return mismatches
+
+
 # This class implements a very simple CFG. It could be very fragile but is good enough for our purposes 
 class CFG:
     def __init__(self, ast):
-        self.startNode = CFGNode(None, 'Start', False, 0)
-        finalid, self.cfg, finalNode = CFG.buildCFG(ast.statement(), self.startNode, 0)
-        self.endNode = CFGNode(None, 'End', False, finalid+1)
+        self.build(ast.statement())
+
+    # Builds the CFG from the top-level statements of a program, which may be any iterable:
+    # every statement is turned into nodes as soon as it is produced and not used afterwards,
+    # so a streaming parser can release it (see streamProgram)
+    def build(self, statements):
+        self.startNode = CFGNode(None, 'Start', False, 0, 'start')
+        self.cfg = self.startNode
+        finalid, finalNode = 0, self.startNode
+        for statement in statements:
+            finalid, first, finalNode = CFG.buildCFG([statement], finalNode, finalid)
+        self.endNode = CFGNode(None, 'End', False, finalid+1, 'end')
         finalNode.setNextBlock(self.endNode)
         self.maxBBId = finalid+1
+        self.buildTables()
 
-    
-    def processSingleStatement(statement, prevNode, bbid):
-        if (isinstance(statement, pointersParser.AssignContext) or
-            isinstance(statement, pointersParser.AllocContext) or
-            isinstance(statement, pointersParser.SkipContext)):
-            newBlock = CFGNode(statement, statement.getText(), False, bbid+1)
-            if prevNode:
-                prevNode.setNextBlock(newBlock)
-            return bbid+1, newBlock, newBlock
-        
-        if isinstance(statement, pointersParser.IfContext):
-            newBlock = CFGNode(None, "IF: [{}]".format(statement.cond.getText()), True, bbid + 1)
-            bbid, ifbranch, endNode1 =  CFG.buildCFG(statement.ifs, None, bbid + 1)
-            bbid, elsebranch, endNode2 =  CFG.buildCFG(statement.elses, None, bbid)
-            newBlock.setBranches(ifbranch, elsebranch)
-            if prevNode:
-                prevNode.setNextBlock(newBlock)
-            joinNode = CFGNode(None, 'Join', False, bbid + 1)            
-            endNode1.setNextBlock(joinNode)
-            endNode2.setNextBlock(joinNode)
-            return bbid + 1, newBlock, joinNode
-        
-        if isinstance(statement, pointersParser.WhileContext):
-            newBlock = CFGNode(statement.cond, "While [{}]".format(statement.cond.getText()), True, bbid+1)
-            if prevNode:
-                prevNode.setNextBlock(newBlock)            
-            bbid, truebranch, endNode1 =  CFG.buildCFG(statement.statement(), None, bbid+1)
-            endNode2 =  CFGNode(None, 'skip', False, bbid+1)
-            endNode1.setNextBlock(newBlock)            
-            newBlock.setBranches(truebranch, endNode2)
-            return bbid+1, newBlock, endNode2
-
-        print("[Warning] Not defined statement: ", type(statement))
-        return bbid, prevNode, prevNode
-        
-    # Goes through the AST and builds a CFG
+    def fromStatements(statements):
+        cfg = CFG.__new__(CFG)
+        cfg.build(statements)
+        return cfg
+
+    # The nodes of one top-level statement in bbid order, numbered from 1 and not linked to
+    # anything that follows (see fromFragments)
+    def fragment(statement):
+        bbid, first, last = CFG.buildCFG([statement], None, 0)
+        nodes = [None] * bbid
+        stack = [first] if first else []
+        while stack:
+            node = stack.pop()
+            nodes[node.bbid - 1] = node
+            for nextBlock in CFG.successors(node):
+                if nodes[nextBlock.bbid - 1] is None:
+                    stack.append(nextBlock)
+        return nodes
+
+    # Builds the CFG of a program from the fragments of its top-level statements, numbering
+    # their nodes anew where they moved. The first kept nodes must be the nodes of previous
+    # with the same bbids (e.g. the fragments of statements an edit did not touch); their
+    # table entries are taken over and only the rest of the graph is walked.
+    def fromFragments(fragments, previous=None, kept=0):
+        cfg = CFG.__new__(CFG)
+        cfg.startNode = previous.startNode if kept else CFGNode(None, 'Start', False, 0, 'start')
+        cfg.cfg = cfg.startNode
+        finalNode = cfg.startNode
+        for nodes in fragments:
+            if not nodes:
+                continue
+            shift = finalNode.bbid + 1 - nodes[0].bbid
+            if shift:
+                for node in nodes:
+                    node.bbid += shift
+                    node.loweredFor = None
+            finalNode.setNextBlock(nodes[0])
+            finalNode = nodes[-1]
+        cfg.endNode = CFGNode(None, 'End', False, finalNode.bbid + 1, 'end')
+        finalNode.setNextBlock(cfg.endNode)
+        cfg.maxBBId = cfg.endNode.bbid
+        cfg.buildTables(previous, kept)
+        return cfg
+
+    # Builds a CFG from nodes that are already linked, indexed by bbid (see deserialize)
+    def fromNodes(nodes):
+        cfg = CFG.__new__(CFG)
+        cfg.startNode = nodes[0]
+        cfg.endNode = nodes[-1]
+        cfg.cfg = cfg.startNode
+        cfg.maxBBId = len(nodes) - 1
+        cfg.buildTables()
+        return cfg
+
+    # ANTLR-free form of the CFG used by cfgCache: [kind, text, successors, statement] for
+    # every node in bbid order. Variables are stored as [name, isNull], an allocation as
+    # [variable, site], an assignment as [variable, variable] and a while node keeps its
+    # condition variable.
+    def serialize(self):
+        def variable(ctx):
+            return [ctx.getText(), statementKind(ctx) == 'null']
+        entries = []
+        for node in self.nodes:
+            content = node.content
+            if node.kind == 'alloc':
+                target = content.variable()
+                payload = [variable(target), node.text[len(target.getText() + ':=newObject'):]]
+            elif node.kind == 'assign':
+                payload = [variable(content.variable(0)), variable(content.variable(1))]
+            elif node.kind == 'while':
+                payload = variable(content)
+            else:
+                payload = None
+            entries.append([node.kind, node.text, list(self.succs[node.bbid]), payload])
+        return entries
+
+    # Rebuilds a CFG from serialize() output. Statements become fastParser nodes.
+    def deserialize(entries):
+        def variable(entry):
+            return fastParser.NullVariable(entry[0]) if entry[1] else fastParser.Variable(entry[0])
+        nodes = []
+        for bbid, (kind, text, successors, payload) in enumerate(entries):
+            if kind == 'alloc':
+                content = fastParser.Alloc(variable(payload[0]), payload[1])
+            elif kind == 'assign':
+                content = fastParser.Assign(variable(payload[0]), variable(payload[1]))
+            elif kind == 'skip':
+                content = fastParser.Skip()
+            elif kind == 'while':
+                content = variable(payload)
+            else:
+                content = None
+            node = CFGNode(content, text, kind == 'if' or kind == 'while', bbid, kind)
+            node.isLoopHead = kind == 'while'
+            nodes.append(node)
+        for node, entry in zip(nodes, entries):
+            successors = [nodes[nextBbid] for nextBbid in entry[2]]
+            if node.isSplit:
+                node.setBranches(successors[0], successors[1])
+            elif successors:
+                node.setNextBlock(successors[0])
+        return CFG.fromNodes(nodes)
+
+    # Flat tables indexed by bbid, filled in one pass over the graph: the node, its kind, its
+    # statement, the bbids of its successors (true branch first) and of its predecessors.
+    # Block ids are dense and increase along every edge except the back edge of a loop.
+    # The entries of the first kept nodes can be copied from the tables of previous (see
+    # fromFragments); the walk then starts at the last of them.
+    def buildTables(self, previous=None, kept=0):
+        size = self.maxBBId + 1
+        if kept:
+            fill = size - kept
+            self.nodes = previous.nodes[:kept] + [None] * fill
+            self.kinds = previous.kinds[:kept] + [None] * fill
+            self.contents = previous.contents[:kept] + [None] * fill
+            self.succs = previous.succs[:kept] + [()] * fill
+            self.preds = previous.preds[:kept] + [[] for i in range(fill)]
+            stack = [self.nodes[kept - 1]]
+        else:
+            self.nodes = [None] * size
+            self.kinds = [None] * size
+            self.contents = [None] * size
+            self.succs = [()] * size
+            self.preds = [[] for i in range(size)]
+            self.nodes[0] = self.startNode
+            stack = [self.startNode]
+        while stack:
+            node = stack.pop()
+            self.kinds[node.bbid] = node.kind
+            self.contents[node.bbid] = node.content
+            successors = CFG.successors(node)
+            self.succs[node.bbid] = tuple(nextBlock.bbid for nextBlock in successors)
+            for nextBlock in successors:
+                self.preds[nextBlock.bbid].append(node.bbid)
+                if self.nodes[nextBlock.bbid] is None:
+                    self.nodes[nextBlock.bbid] = nextBlock
+                    stack.append(nextBlock)
+        for predecessors in itertools.islice(self.preds, kept, None):
+            predecessors.sort()
+        self.loweredFor = None
+
+    # Lowers the statement of every node to an instruction (see lowerStatement) over the
+    # slots of index, a persistentMap.KeyIndex. Done once per index, so the transfer
+    # functions never look at the parse tree. Nodes shared with another CFG that was lowered
+    # for the same index keep their instruction, unless they were numbered anew (an
+    # allocation's site is its bbid).
+    def lower(self, index):
+        if self.loweredFor is index:
+            return
+        for node in self.nodes:
+            if node.loweredFor is not index:
+                node.instr = lowerStatement(node, index.slots)
+                node.loweredFor = index
+        self.loweredFor = index
+
+
+    # Goes through the AST and builds a CFG. Returns the last bbid handed out and the first and
+    # last node of the statements. The statement lists that are still being built are kept on
+    # an explicit stack, so a program can be nested to any depth, and every statement is
+    # handled once.
     def buildCFG(program, prevNode, bbid):
-        startElement = prevNode
-        while len(program) > 0:
-            nextStatement = program.pop(0)
-            bbid, newNode, endNode = CFG.processSingleStatement(nextStatement, prevNode, bbid)
-            if startElement == None:
-                startElement = newNode
-            prevNode = endNode
-        return bbid, startElement, prevNode
-       
+        # A frame is [statements, index of the next statement, first node, last node, owner].
+        # owner is None for program and (node, statement) for a branch of an if or while, with
+        # the first and last node of the true branch added while the false branch is built.
+        stack = [[program, 0, prevNode, prevNode, None]]
+        while True:
+            frame = stack[-1]
+            statements, index, first, last, owner = frame
+            if index < len(statements):
+                frame[1] = index + 1
+                bbid = CFG.processSingleStatement(statements[index], stack, bbid)
+                continue
+            stack.pop()
+            if owner is None:
+                return bbid, first, last
+            node, statement = owner[:2]
+            if node.kind == 'if' and len(owner) == 2:
+                stack.append([statement.elses, 0, None, None, (node, statement, first, last)])
+                continue
+            bbid += 1
+            if node.kind == 'if':
+                ifbranch, endNode1 = owner[2:]
+                node.setBranches(ifbranch, first)
+                endNode = CFGNode(None, 'Join', False, bbid, 'join')
+                endNode1.setNextBlock(endNode)
+                last.setNextBlock(endNode)
+            else:
+                endNode = CFGNode(None, 'skip', False, bbid, 'exit')
+                last.setNextBlock(node)
+                node.setBranches(first, endNode)
+            CFG.appendNodes(stack[-1], node, endNode)
+
+    # Adds the nodes of one statement to the innermost frame of the buildCFG stack, or for if
+    # and while pushes a frame for their first branch. Returns the last bbid handed out.
+    def processSingleStatement(statement, stack, bbid):
+        kind = statementKind(statement)
+        if kind == 'assign' or kind == 'alloc' or kind == 'skip':
+            newBlock = CFGNode(statement, statement.getText(), False, bbid+1, kind)
+            CFG.appendNodes(stack[-1], newBlock, newBlock)
+            return bbid+1
+
+        if kind == 'if':
+            newBlock = CFGNode(None, "IF: [{}]".format(statement.cond.getText()), True, bbid + 1, 'if')
+            stack.append([statement.ifs, 0, None, None, (newBlock, statement)])
+            return bbid+1
+
+        if kind == 'while':
+            newBlock = CFGNode(statement.cond, "While [{}]".format(statement.cond.getText()), True, bbid+1, 'while')
+            newBlock.isLoopHead = True
+            stack.append([statement.statement(), 0, None, None, (newBlock, statement)])
+            return bbid+1
+
+        print("[Warning] Not defined statement: ", type(statement), file=sys.stderr)
+        frame = stack[-1]
+        if frame[2] is None:
+            frame[2] = frame[3]
+        return bbid
+
+    # Appends a statement, whose nodes run from start to end, to the statements of a frame
+    def appendNodes(frame, start, end):
+        if frame[3]:
+            frame[3].setNextBlock(start)
+        if frame[2] is None:
+            frame[2] = start
+        frame[3] = end
+
     def printCFG(start, bbid):
-        node = start
-        while (node != None):
+        for line in CFG.iterCFG(start):
+            print(line)
+
+    # The lines printed by printCFG
+    def listCFG(start, lines):
+        lines.extend(CFG.iterCFG(start))
+        return lines
+
+    # Yields the lines of the listing: a node, and for a split node the listing of its true
+    # branch and then of its false branch, each followed until the end of the program or a
+    # back edge. Branches are continued from an explicit stack.
+    def iterCFG(start):
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            yield '{} {}'.format(node.text, node.bbid)
+            nextBlock = node.nextblock
+            stack.append(nextBlock if nextBlock and nextBlock.bbid > node.bbid else None)
             if node.isSplit:
-                print(node.text, node.bbid)
-                CFG.printCFG(node.trueCase, node.bbid)
-                CFG.printCFG(node.falseCase, node.bbid)
-            else:
-                print(node.text, node.bbid)
-            if node.nextblock and node.nextblock.bbid <= node.bbid:
-                break                
-            node = node.nextblock
+                stack.append(node.falseCase)
+                stack.append(node.trueCase)
 
-    def drawCFG(startNode):
+    # Writes the CFG through networkx and pygraphviz. They are only imported when this is
+    # called; cfgExport writes the same graph without them.
+    def drawCFG(self, path='test.dot'):
+        import networkx as nx
         G = nx.DiGraph()
-        CFG.drawCFGHelper(startNode, 0, G)        
-        nx.nx_agraph.write_dot(G,'test.dot')
+        self.drawCFGHelper(G)
+        nx.nx_agraph.write_dot(G, path)
 
-    def drawCFGHelper(start, bbid, G):
+    def drawCFGHelper(self, G):
         nodeFormatStr = "[Id: {}]: {}"
-        node = start
-        while (node != None):
-            G.add_node(nodeFormatStr.format(node.bbid, node.text))
-            if node.isSplit:
-                CFG.drawCFGHelper(node.trueCase, node.bbid, G)
-                CFG.drawCFGHelper(node.falseCase, node.bbid, G)
-                G.add_edge(nodeFormatStr.format(node.bbid, node.text), nodeFormatStr.format(node.trueCase.bbid, node.trueCase.text))
-                G.add_edge(nodeFormatStr.format(node.bbid, node.text), nodeFormatStr.format(node.falseCase.bbid, node.falseCase.text))
+        labels = [nodeFormatStr.format(node.bbid, node.text) for node in self.nodes]
+        for bbid in range(len(self.nodes)):
+            G.add_node(labels[bbid])
+            for nextBbid in self.succs[bbid]:
+                G.add_edge(labels[bbid], labels[nextBbid])
+
+    # Successors of a node in the CFG, true branch first for split nodes
+    def successors(node):
+        if node.isSplit:
+            return [node.trueCase, node.falseCase]
+        if node.nextblock:
+            return [node.nextblock]
+        return []
+
+    # Nodes reachable from the start node in reverse postorder, computed with an explicit stack
+    def reversePostorder(self):
+        order = []
+        visited = [False] * len(self.nodes)
+        visited[0] = True
+        stack = [(0, iter(self.succs[0]))]
+        while stack:
+            bbid, children = stack[-1]
+            for child in children:
+                if not visited[child]:
+                    visited[child] = True
+                    stack.append((child, iter(self.succs[child])))
+                    break
             else:
-                if node.nextblock: 
-                    G.add_edge(nodeFormatStr.format(node.bbid, node.text), nodeFormatStr.format(node.nextblock.bbid, node.nextblock.text))
-            if node.nextblock and node.nextblock.bbid <= node.bbid:
-                break
-            node = node.nextblock
+                stack.pop()
+                order.append(self.nodes[bbid])
+        order.reverse()
+        return order
+
+    # Maximal straight-line runs of nodes as lists of bbids, ordered by their first node.
+    # Every node of a block but the first has exactly one predecessor, the node before it,
+    # and every node but the last exactly one successor, the node after it.
+    def basicBlocks(self):
+        def startsBlock(bbid):
+            predecessors = self.preds[bbid]
+            return bbid == 0 or len(predecessors) != 1 or len(self.succs[predecessors[0]]) != 1
+        blocks = []
+        for bbid in range(len(self.nodes)):
+            if not startsBlock(bbid):
+                continue
+            block = [bbid]
+            while len(self.succs[block[-1]]) == 1 and not startsBlock(self.succs[block[-1]][0]):
+                block.append(self.succs[block[-1]][0])
+            blocks.append(block)
+        return blocks
+
+    # Immediate dominator of every node (the start node is its own), computed with the
+    # iterative algorithm of Cooper, Harvey and Kennedy over the reverse postorder
+    def dominators(self):
+        order = [node.bbid for node in self.reversePostorder()]
+        position = [0] * len(self.nodes)
+        for index, bbid in enumerate(order):
+            position[bbid] = index
+        idom = [None] * len(self.nodes)
+        idom[0] = 0
+        changed = True
+        while changed:
+            changed = False
+            for bbid in order[1:]:
+                newIdom = None
+                for pred in self.preds[bbid]:
+                    if idom[pred] is None:
+                        continue
+                    if newIdom is None:
+                        newIdom = pred
+                        continue
+                    a, b = pred, newIdom
+                    while a != b:
+                        while position[a] > position[b]:
+                            a = idom[a]
+                        while position[b] > position[a]:
+                            b = idom[b]
+                    newIdom = a
+                if idom[bbid] != newIdom:
+                    idom[bbid] = newIdom
+                    changed = True
+        return idom
+
+    # Dominance frontier of every node, as sets of bbids
+    def dominanceFrontiers(self, idom):
+        frontiers = [set() for i in range(len(self.nodes))]
+        for bbid, predecessors in enumerate(self.preds):
+            if len(predecessors) < 2:
+                continue
+            for pred in predecessors:
+                runner = pred
+                while runner != idom[bbid]:
+                    frontiers[runner].add(bbid)
+                    runner = idom[runner]
+        return frontiers
+
+    # A parser independent description of the CFG, used to check that both parsers agree
+    def describe(self):
+        res = []
+        for node in self.nodes:
+            res.append((node.bbid, node.text, node.kind, statementKind(node.content), list(self.succs[node.bbid])))
+        return res
 
+    # All nodes of the CFG. Block ids are handed out in the order of a walk that lists a split
+    # node, then its true branch, then its false branch and what follows it, so this is the
+    # order in which the nodes were visited by the recursive traversal this replaces.
     def getList(self):
-        node = self.startNode
-        return CFG.getListHelper(node, [])
+        return list(self.nodes)
 
-    def getListHelper(node, statementList):
-        if node.isSplit:
-            l1 = CFG.getListHelper(node.trueCase, [])
-            l2 = CFG.getListHelper(node.falseCase, [])
-            return statementList + [node] + l1 + l2
+
+# Worklist used by the fixpoint engine. A node is never queued twice: pushing a node
+# that is already waiting is a no-op. Without a priority nodes come out in FIFO order,
+# otherwise the waiting node with the smallest priority[bbid] is handed out first.
+class Worklist:
+    def __init__(self, priority=None):
+        self.priority = priority
+        self.members = set()
+        if priority is None:
+            self.queue = collections.deque()
         else:
-            if node.nextblock and node.nextblock.bbid == node.bbid+1:
-                return statementList + [node] + CFG.getListHelper(node.nextblock, [])
-            else:
-                return statementList + [node]
-            
+            self.queue = []
+
+    def push(self, node):
+        if node.bbid in self.members:
+            return
+        self.members.add(node.bbid)
+        if self.priority is None:
+            self.queue.append(node)
+        else:
+            heapq.heappush(self.queue, (self.priority[node.bbid], node.bbid, node))
+
+    def pop(self):
+        if self.priority is None:
+            node = self.queue.popleft()
+        else:
+            node = heapq.heappop(self.queue)[2]
+        self.members.discard(node.bbid)
+        return node
+
+    def __len__(self):
+        return len(self.queue)
+
 
 class AbstractInterpretation():
-    def __init__(self, ast, cfg, absDomain):
+    # Iteration orders understood by makeWorklist
+    orders = ('fifo', 'rpo')
+
+    # absDomain is an abstractDomain.AbstractDomain. If it supportsWidening, widen(oldState,
+    # newState) is applied at loop heads once a loop head has been updated more than
+    # wideningDelay times, and up to narrowingPasses descending passes with narrow(oldState,
+    # newState) follow the fixpoint.
+    # stats is an optional fixpointStats.FixpointStats that collects counters while running.
+    # absDomain may be a tuple of domains, which are analyzed together as a ProductDomain.
+    # previous is a finished analysis of the same variables whose states of the blocks in
+    # reused are taken over (see reuseStates); every other block starts from bottom.
+    def __init__(self, ast, cfg, absDomain, order='fifo', wideningDelay=3, narrowingPasses=1, stats=None,
+                 previous=None, reused=()):
         self.ast = ast        
         self.cfg = cfg
-        self.absDomain = absDomain
-        self.stateMap = self.getInitialStateMap()
+        self.stats = stats
+        if isinstance(absDomain, tuple):
+            absDomain = ProductDomain(absDomain)
+        self.absDomain = stats.wrapDomain(absDomain) if stats else absDomain
+        self.order = order
+        self.wideningDelay = wideningDelay
+        self.narrowingPasses = narrowingPasses
+        if previous is None:
+            self.stateMap = self.getInitialStateMap()
+        else:
+            self.stateMap = self.reuseStates(previous, reused)
         self.statementList = cfg.getList()
+        self.loopHeads = set(node.bbid for node in self.statementList if node.isLoopHead)
+        self.loopVisits = {}
+
+    # Domains with their own state representation (e.g. MatrixPointersDomain) provide
+    # initialState(index), the bottom state over the variables of a KeyIndex
+    def makeBottomState(self):
+        initialState = getattr(self.absDomain, 'initialState', None)
+        if initialState:
+            self.bottomState = initialState(KeyIndex(programVariables(self.ast)))
+        else:
+            self.bottomState = PersistentMap.fromKeys(programVariables(self.ast), self.absDomain.bottomElement)
+        self.cfg.lower(self.bottomState.index)
 
     def getInitialStateMap(self):
-        variableExplorer = getVarSet()
-        walker = ParseTreeWalker()
-        walker.walk(variableExplorer, self.ast)
+        # All blocks start out sharing one bottom state, copying a PersistentMap is O(1)
+        self.makeBottomState()
         stateMap = {}
         for i in range(self.cfg.maxBBId+1):
-            stateMap[i] = dict.fromkeys(variableExplorer.varset, self.absDomain.bottomElement)        
+            stateMap[i] = self.bottomState.copy()
         return stateMap
 
+    # The state map with the states of the blocks in bbids taken over from a finished
+    # analysis of the same variables. Every other block starts again from bottom. The bottom
+    # state of the previous analysis is used so that all states share one KeyIndex, and the
+    # CFG is only lowered for that index.
+    def reuseStates(self, previous, bbids):
+        self.bottomState = previous.bottomState
+        self.cfg.lower(self.bottomState.index)
+        stateMap = {}
+        for i in range(self.cfg.maxBBId+1):
+            if i in bbids:
+                stateMap[i] = previous.stateMap[i]
+            else:
+                stateMap[i] = self.bottomState.copy()
+        return stateMap
+
+    # The state of a block as printed. Domains with an encoded representation (e.g.
+    # BitVectorPointersDomain) provide a decode function that turns a value back into
+    # the set printed by PointersDomain.
+    def getAbsState(self, key):
+        decode = getattr(self.absDomain, 'decode', None)
+        state = self.stateMap[key]
+        if decode:
+            return {var: decode(value) for var, value in state.items()}
+        return dict(state.items())
+
     def printAbsState(self):
         for key in self.stateMap:
-            print(key, repr(sorted(self.stateMap[key].items())))
+            print(key, resultWriter.textEntries((var, resultWriter.textValue(value)) for var, value in sorted(self.getAbsState(key).items())))
 
-    def run(self):
-        self.runHelper(self.statementList.copy())
+    def makeWorklist(self):
+        if self.order == 'fifo':
+            return Worklist()
+        if self.order == 'rpo':
+            priority = {}
+            for index, node in enumerate(self.cfg.reversePostorder()):
+                priority[node.bbid] = index
+            return Worklist(priority)
+        raise ValueError("Unknown iteration order: {}".format(self.order))
 
-    def runHelper(self, nodeList):
-        if len(nodeList) == 0:
-            return 
-        node = nodeList.pop(0)
-        if not node.isSplit:
-            nextBlock = node.nextblock
-            if nextBlock:
-                myState = self.stateMap[node.bbid]
-                oldState = self.stateMap[nextBlock.bbid].copy()
+    # seeds are the nodes queued initially, all nodes unless only part of the CFG needs
+    # to be recomputed
+    def run(self, seeds=None):
+        worklist = self.makeWorklist()
+        if self.stats:
+            worklist = self.stats.wrapWorklist(worklist)
+        for node in (self.statementList if seeds is None else seeds):
+            worklist.push(node)
+        self.runHelper(worklist)
+        if self.loopVisits and self.absDomain.supportsWidening:
+            self.narrowHelper()
+
+    # Iterates until the worklist is empty. Processing a node pushes its state into
+    # each of its successors, and a successor is queued again only if its state changed.
+    def runHelper(self, worklist):
+        widen = self.absDomain.widen if self.absDomain.supportsWidening else None
+        nodes = self.cfg.nodes
+        succs = self.cfg.succs
+        while worklist:
+            node = worklist.pop()
+            myState = self.stateMap[node.bbid]
+            for nextBbid in succs[node.bbid]:
+                nextBlock = nodes[nextBbid]
+                oldState = self.stateMap[nextBlock.bbid]
                 newState = self.absDomain.statementTransfer(nextBlock, myState, oldState)
-                self.stateMap[nextBlock.bbid] = self.absDomain.merge(oldState, newState)
                 if self.absDomain.isEqual(oldState, newState):
-                    return self.runHelper(nodeList)
-                else:
-                    return self.runHelper(nodeList + [nextBlock])
-            else:
-                return self.runHelper(nodeList)
-        else:
-            myState = self.stateMap[node.bbid]
-            oldStateT = self.stateMap[node.trueCase.bbid].copy()            
-            newStateT = self.absDomain.statementTransfer(node.trueCase, myState, oldStateT)
-            oldStateF = self.stateMap[node.falseCase.bbid].copy()
-            newStateF = self.absDomain.statementTransfer(node.falseCase, myState, oldStateF)
-
-            if self.absDomain.isEqual(oldStateT, newStateT):
-                if self.absDomain.isEqual(oldStateF, newStateF):
-                    return self.runHelper(nodeList)
-                else:
-                    self.stateMap[node.falseCase.bbid] = self.absDomain.merge(oldStateF, newStateF)
-                    return self.runHelper(nodeList + [node.falseCase])
+                    continue
+                mergedState = self.absDomain.merge(oldState, newState)
+                if widen and nextBlock.bbid in self.loopHeads:
+                    visits = self.loopVisits.get(nextBlock.bbid, 0) + 1
+                    self.loopVisits[nextBlock.bbid] = visits
+                    if visits > self.wideningDelay:
+                        mergedState = widen(oldState, mergedState)
+                if not self.absDomain.isEqual(oldState, mergedState):
+                    self.stateMap[nextBlock.bbid] = mergedState
+                    worklist.push(nextBlock)
+
+    # Descending iteration after a widened fixpoint: every block is recomputed from its
+    # predecessors in reverse postorder, and loop heads combine the old and the recomputed
+    # state with the domain's narrow operator.
+    def narrowHelper(self):
+        order = self.cfg.reversePostorder()
+        for i in range(self.narrowingPasses):
+            changed = False
+            for node in order:
+                if not self.cfg.preds[node.bbid]:
+                    continue
+                newState = self.absDomain.mergeMany([
+                    self.absDomain.statementTransfer(node, self.stateMap[pred], self.stateMap[node.bbid])
+                    for pred in self.cfg.preds[node.bbid]])
+                if node.bbid in self.loopHeads:
+                    newState = self.absDomain.narrow(self.stateMap[node.bbid], newState)
+                if not self.absDomain.isEqual(self.stateMap[node.bbid], newState):
+                    self.stateMap[node.bbid] = newState
+                    changed = True
+            if not changed:
+                break
+
+
+# The solver of AbstractInterpretation run over basic blocks (see CFG.basicBlocks) instead of
+# single nodes. The statements of a block after its first node are composed into one
+# transfer function, a list of (dst, src, value) meaning dst := input[src] if src is not None
+# and dst := value otherwise. Only the state at the entry of every block (the state of its
+# first node) is stored and only blocks are queued. The state of any other node is
+# recomputed from the entry state of its block when it is looked up.
+class BlockInterpretation(AbstractInterpretation):
+    def __init__(self, ast, cfg, absDomain, order='fifo', wideningDelay=3, narrowingPasses=1, stats=None):
+        self.ast = ast
+        self.cfg = cfg
+        self.stats = stats
+        if isinstance(absDomain, tuple):
+            absDomain = ProductDomain(absDomain)
+        self.absDomain = stats.wrapDomain(absDomain) if stats else absDomain
+        self.order = order
+        self.wideningDelay = wideningDelay
+        self.narrowingPasses = narrowingPasses
+        self.makeBottomState()
+        self.blocks = cfg.basicBlocks()
+        self.blockOf = [None] * len(cfg.nodes)
+        for index, block in enumerate(self.blocks):
+            for bbid in block:
+                self.blockOf[bbid] = index
+        self.entryStates = [self.bottomState] * len(self.blocks)
+        # Domains with their own state type, or whose transfers are not constant (see
+        # AbstractDomain.constantTransfers), apply the statements of a block one by one
+        self.summaries = [None] * len(self.blocks)
+        if not hasattr(absDomain, 'initialState') and absDomain.constantTransfers:
+            self.summaries = [self.summarize(block) for block in self.blocks]
+        self.stateMap = LazyStateMap(self)
+        self.loopHeads = set(node.bbid for node in cfg.nodes if node.isLoopHead)
+        self.loopVisits = {}
+        self.cachedBlock = None
+        self.cachedStates = None
+
+    def summarize(self, block):
+        effects = {}
+        for bbid in block[1:]:
+            node = self.cfg.nodes[bbid]
+            op, dst, src = node.instr
+            if op == COPY:
+                effects[dst] = effects.get(src, (src, None))
+            elif op != NOP:
+                effects[dst] = (None, self.absDomain.statementTransfer(node, self.bottomState, self.bottomState).getSlot(dst))
+        return [(dst, src, value) for dst, (src, value) in sorted(effects.items()) if src != dst]
+
+    # The state of the last node of a block
+    def exitState(self, index):
+        state = self.entryStates[index]
+        summary = self.summaries[index]
+        if summary is None:
+            return self.absDomain.transferBlock([self.cfg.nodes[bbid] for bbid in self.blocks[index][1:]], state)
+        newState = state.copy()
+        for dst, src, value in summary:
+            newState.setSlot(dst, value if src is None else state.getSlot(src))
+        return newState
+
+    def run(self):
+        worklist = self.makeWorklist()
+        if self.stats:
+            worklist = self.stats.wrapWorklist(worklist)
+        for block in self.blocks:
+            worklist.push(self.cfg.nodes[block[0]])
+        self.runHelper(worklist)
+        if self.loopVisits and self.absDomain.supportsWidening:
+            self.narrowHelper()
+        self.cachedBlock = None
+
+    # Same iteration as AbstractInterpretation.runHelper, with the worklist holding the first
+    # nodes of blocks
+    def runHelper(self, worklist):
+        widen = self.absDomain.widen if self.absDomain.supportsWidening else None
+        nodes = self.cfg.nodes
+        succs = self.cfg.succs
+        while worklist:
+            index = self.blockOf[worklist.pop().bbid]
+            myState = self.exitState(index)
+            for nextBbid in succs[self.blocks[index][-1]]:
+                nextIndex = self.blockOf[nextBbid]
+                oldState = self.entryStates[nextIndex]
+                newState = self.absDomain.statementTransfer(nodes[nextBbid], myState, oldState)
+                if self.absDomain.isEqual(oldState, newState):
+                    continue
+                mergedState = self.absDomain.merge(oldState, newState)
+                if widen and nextBbid in self.loopHeads:
+                    visits = self.loopVisits.get(nextBbid, 0) + 1
+                    self.loopVisits[nextBbid] = visits
+                    if visits > self.wideningDelay:
+                        mergedState = widen(oldState, mergedState)
+                if not self.absDomain.isEqual(oldState, mergedState):
+                    self.entryStates[nextIndex] = mergedState
+                    worklist.push(nodes[nextBbid])
+
+    def narrowHelper(self):
+        heads = [node for node in self.cfg.reversePostorder() if self.blocks[self.blockOf[node.bbid]][0] == node.bbid]
+        for i in range(self.narrowingPasses):
+            changed = False
+            for node in heads:
+                index = self.blockOf[node.bbid]
+                if not self.cfg.preds[node.bbid]:
+                    continue
+                newState = self.absDomain.mergeMany([
+                    self.absDomain.statementTransfer(node, self.exitState(self.blockOf[pred]), self.entryStates[index])
+                    for pred in self.cfg.preds[node.bbid]])
+                if node.bbid in self.loopHeads:
+                    newState = self.absDomain.narrow(self.entryStates[index], newState)
+                if not self.absDomain.isEqual(self.entryStates[index], newState):
+                    self.entryStates[index] = newState
+                    changed = True
+            if not changed:
+                break
+
+    # The states of the nodes of the block last looked up are kept, so listing all states in
+    # bbid order recomputes every block once
+    def stateAt(self, bbid):
+        index = self.blockOf[bbid]
+        if index != self.cachedBlock:
+            state = self.entryStates[index]
+            states = {self.blocks[index][0]: state}
+            for nodeBbid in self.blocks[index][1:]:
+                state = self.absDomain.statementTransfer(self.cfg.nodes[nodeBbid], state, state)
+                states[nodeBbid] = state
+            self.cachedBlock = index
+            self.cachedStates = states
+        return self.cachedStates[bbid]
+
+
+# The states of a SparseInterpretation, rebuilt when they are looked up
+class LazyStateMap:
+    def __init__(self, analysis):
+        self.analysis = analysis
+
+    def __getitem__(self, bbid):
+        return self.analysis.stateAt(bbid)
+
+    def __iter__(self):
+        return iter(range(self.analysis.cfg.maxBBId + 1))
+
+    def __len__(self):
+        return self.analysis.cfg.maxBBId + 1
+
+
+# Sparse alternative to the dense solver, for domains without widening whose states are
+# PersistentMaps. The program is put in SSA form over the lowered instructions: every
+# assignment and allocation defines a new name for its variable and phis are placed at the
+# iterated dominance frontiers of the definitions. Values then flow only from a name to the
+# names that use it (copies and phis), instead of through every node in between.
+# The state of a node is rebuilt on demand from the state of its immediate dominator and the
+# names defined at the node, which gives the states of the dense solver. An allocation or
+# null assignment defines a constant name, so the domain's transfers must be constant (see
+# AbstractDomain.constantTransfers).
+class SparseInterpretation(AbstractInterpretation):
+    CONST, COPY, PHI = range(3)
+
+    def __init__(self, ast, cfg, absDomain):
+        if hasattr(absDomain, 'initialState') or not absDomain.finiteHeight or not absDomain.constantTransfers:
+            raise ValueError('The sparse solver needs PersistentMap states and a domain of finite height with constant transfers')
+        self.ast = ast
+        self.cfg = cfg
+        self.absDomain = absDomain
+        self.makeBottomState()
+        self.stateMap = LazyStateMap(self)
+        # Name 0 is the bottom value every variable has at the start node
+        self.kinds = [SparseInterpretation.CONST]
+        self.operands = [None]
+        self.values = [absDomain.bottomElement]
+        self.users = [[]]
+        self.phiCount = 0
+        self.evaluations = 0
+
+    def newName(self, kind, operands, value):
+        self.kinds.append(kind)
+        self.operands.append(operands)
+        self.values.append(value)
+        self.users.append([])
+        return len(self.kinds) - 1
+
+    # Variables (slots) that need a phi at every node
+    def placePhis(self, frontiers):
+        phiVars = [[] for i in range(len(self.cfg.nodes))]
+        defSites = [[] for i in range(len(self.bottomState))]
+        for node in self.cfg.nodes:
+            op, dst, src = node.instr
+            if op != NOP:
+                defSites[dst].append(node.bbid)
+        for slot, sites in enumerate(defSites):
+            hasPhi = set()
+            work = list(sites)
+            queued = set(sites)
+            while work:
+                for bbid in frontiers[work.pop()]:
+                    if bbid not in hasPhi:
+                        hasPhi.add(bbid)
+                        phiVars[bbid].append(slot)
+                        if bbid not in queued:
+                            queued.add(bbid)
+                            work.append(bbid)
+        return phiVars
+
+    # Walks the dominator tree with a stack of names per variable, creating a name for every
+    # definition and phi and recording the operands of copies and phis
+    def rename(self, children, phiVars):
+        cfg = self.cfg
+        bottom = self.absDomain.bottomElement
+        phiNames = [[self.newName(SparseInterpretation.PHI, [], bottom) for slot in phiVars[bbid]]
+                    for bbid in range(len(cfg.nodes))]
+        self.phiCount = sum(len(names) for names in phiNames)
+        self.updates = [()] * len(cfg.nodes)
+        stacks = [[0] for i in range(len(self.bottomState))]
+        walk = [(0, False)]
+        while walk:
+            bbid, leaving = walk.pop()
+            if leaving:
+                for slot, name in self.updates[bbid]:
+                    stacks[slot].pop()
+                continue
+            updates = list(zip(phiVars[bbid], phiNames[bbid]))
+            node = cfg.nodes[bbid]
+            op, dst, src = node.instr
+            if op == COPY:
+                operand = stacks[src][-1]
+                name = self.newName(SparseInterpretation.COPY, operand, bottom)
+                self.users[operand].append(name)
+                updates.append((dst, name))
+            elif op != NOP:
+                value = self.absDomain.statementTransfer(node, self.bottomState, self.bottomState).getSlot(dst)
+                updates.append((dst, self.newName(SparseInterpretation.CONST, None, value)))
+            for slot, name in updates:
+                stacks[slot].append(name)
+            self.updates[bbid] = updates
+            for nextBbid in cfg.succs[bbid]:
+                for slot, name in zip(phiVars[nextBbid], phiNames[nextBbid]):
+                    operand = stacks[slot][-1]
+                    self.operands[name].append(operand)
+                    self.users[operand].append(name)
+            walk.append((bbid, True))
+            walk.extend((child, False) for child in reversed(children[bbid]))
+
+    # Computes the value of every name, re-evaluating a name only when one of its operands
+    # changed
+    def solve(self):
+        kinds, operands, values, users = self.kinds, self.operands, self.values, self.users
+        lub = self.absDomain.lub
+        bitset = self.absDomain.supportsBitset
+        work = collections.deque(name for name, kind in enumerate(kinds) if kind != SparseInterpretation.CONST)
+        queued = [kind != SparseInterpretation.CONST for kind in kinds]
+        while work:
+            name = work.popleft()
+            queued[name] = False
+            self.evaluations += 1
+            if kinds[name] == SparseInterpretation.COPY:
+                value = values[operands[name]]
+            elif bitset:
+                value = 0
+                for operand in operands[name]:
+                    value |= values[operand]
+                value = self.absDomain.normalize(value)
             else:
-                self.stateMap[node.trueCase.bbid] = self.absDomain.merge(oldStateT, newStateT)
-                if self.absDomain.isEqual(oldStateF, newStateF):
-                    return self.runHelper(nodeList + [node.trueCase])
-                else:
-                    self.stateMap[node.falseCase.bbid] = self.absDomain.merge(oldStateF, newStateF)
-                    return self.runHelper(nodeList + [node.trueCase, node.falseCase])
+                value = values[operands[name][0]]
+                for operand in operands[name][1:]:
+                    value = lub(value, values[operand])
+            if value != values[name]:
+                values[name] = value
+                for user in users[name]:
+                    if not queued[user]:
+                        queued[user] = True
+                        work.append(user)
+
+    def run(self):
+        cfg = self.cfg
+        idom = cfg.dominators()
+        children = [[] for i in range(len(cfg.nodes))]
+        for bbid in range(1, len(cfg.nodes)):
+            if idom[bbid] is not None:
+                children[idom[bbid]].append(bbid)
+        # Nodes the start node does not reach keep the bottom state
+        self.idom = [0 if dominator is None else dominator for dominator in idom]
+        self.rename(children, self.placePhis(cfg.dominanceFrontiers(idom)))
+        self.solve()
+        self.states = {0: self.bottomState}
+
+    def stateAt(self, bbid):
+        chain = []
+        while bbid not in self.states:
+            chain.append(bbid)
+            bbid = self.idom[bbid]
+        state = self.states[bbid]
+        for bbid in reversed(chain):
+            if self.updates[bbid]:
+                state = state.copy()
+                for slot, name in self.updates[bbid]:
+                    state.setSlot(slot, self.values[name])
+            self.states[bbid] = state
+        return state
 
 
-class PointersDomain():
+# The methods are static so that PointersDomain.lub etc. can be called on the class as well
+class PointersDomain(AbstractDomain):
+    finiteHeight = True
+    constantTransfers = True
     topElement = set(['null'])
     bottomElement = set([])
 
@@ -209,6 +1073,7 @@ class PointersDomain():
     # Implement the latice for Allocation sites here.
     # We have already defined the bottom element to be the empty set and the top element to be a set with ['null']
     # Elements of the abstractDomain are sets of object allocation sites
+    @staticmethod
     def lub(a, b):
         if a == PointersDomain.topElement or b == PointersDomain.topElement:
             return PointersDomain.topElement
@@ -216,75 +1081,419 @@ class PointersDomain():
 
     # Checks if two abstract states are the same
     # Remember that the abstract states map each variable to a element in the abstract domain
+    # (a PersistentMap, see AbstractInterpretation.getInitialStateMap)
+    @staticmethod
     def isEqual(state1, state2):
-        for var in state1:
-            if var not in state2:
-                return False
-            if state1[var] != state2[var]:
-                return False
-        return True
+        return state1 == state2
 
     # This is the main tranfer function that need to be implemented.
     # For each type of statement define how the currentState get transformed and return the updated state.
+    # The statement is read from block.instr (see CFG.lower), its variables are slots of the state.
+    @staticmethod
     def statementTransfer(block, currentState, nextAbstractState):
+        op, dst, src = block.instr
         newState = currentState.copy()
-        if isinstance(block.content, pointersParser.SkipContext):
-            # what needs to happen if it is a skip statement
-            return currentState.copy()
-        elif isinstance(block.content, pointersParser.AssignContext):
-            var_a = block.content.variable(0).getText()
-            if not isinstance(block.content.variable(1), pointersParser.NullvarContext):
-                var = block.content.variable(1).getText()
-                # what need to be done if the variable is assigned another variable
-                newState[var_a] = currentState[var]
-                return newState
-            else:
-                # what need to be done if the variable is assigned null                
-                newState[var_a] = PointersDomain.topElement
-                return newState
-        elif isinstance(block.content, pointersParser.AllocContext):
-            # how to handle the newObject statement
-            # use block.bbid to access the block id of the current CFG node
-            # use block.content.variable().getText() to access the variable being assigned
-            var = block.content.variable().getText()
-            if var not in currentState:
-                newState[var] = PointersDomain.bottomElement
-            #newState[var] = newState[var].union({block.bbid})
-            newState[var] = {block.bbid}
-            return newState
-        else:
-            # For split nodes in the CFG we will be adding join nodes. Those nodes do not change the state
-            return currentState.copy()
+        if op == COPY:
+            # what need to be done if the variable is assigned another variable
+            newState.setSlot(dst, currentState.getSlot(src))
+        elif op == NULL:
+            # what need to be done if the variable is assigned null
+            newState.setSlot(dst, PointersDomain.topElement)
+        elif op == ALLOC:
+            # how to handle the newObject statement, src is the block id of the allocation
+            newState.setSlot(dst, {src})
+        # skip, split and join nodes do not change the state
+        return newState
 
     # how do we merge two abstract states togeter
     # Remember that the abstract states map each variable to a element in the abstract domain
     # hint use the PointersDomain.lub function
+    @staticmethod
     def merge(abstractState1, abstractState2):
-        res = {}
-        for key in abstractState1.keys():
-            res[key] = PointersDomain.lub(abstractState1[key], abstractState2[key])
+        return abstractState1.combine(abstractState2, PointersDomain.lub)
+
+
+# Same lattice as PointersDomain, but each points-to set is an int used as a bitmask.
+# Bit 0 stands for 'null' and every allocation site of the program is interned to one of
+# the following bits, so lub is a bitwise or and equality is a plain int comparison.
+# The site numbering belongs to one program, so a new instance is needed for every CFG.
+class BitVectorPointersDomain(AbstractDomain):
+    finiteHeight = True
+    constantTransfers = True
+    supportsBitset = True
+    nullBit = 1
+    topElement = nullBit
+    bottomElement = 0
+
+    def __init__(self, cfg):
+        self.sites = ['null']
+        self.siteBits = {}
+        self.addSites(cfg)
+
+    # Interns the allocation sites of cfg that have no bit yet. Bits already handed out keep
+    # their meaning, so states encoded for an earlier version of the program stay valid.
+    def addSites(self, cfg):
+        for node in cfg.getList():
+            if statementKind(node.content) == 'alloc' and node.bbid not in self.siteBits:
+                self.siteBits[node.bbid] = 1 << len(self.sites)
+                self.sites.append(node.bbid)
+
+    def lub(self, a, b):
+        return self.normalize(a | b)
+
+    # 'null' is absorbing, so any union containing it collapses to the top element
+    def normalize(self, value):
+        if value & BitVectorPointersDomain.nullBit:
+            return BitVectorPointersDomain.topElement
+        return value
+
+    def isEqual(self, state1, state2):
+        return state1 == state2
+
+    def statementTransfer(self, block, currentState, nextAbstractState):
+        op, dst, src = block.instr
+        newState = currentState.copy()
+        if op == COPY:
+            newState.setSlot(dst, currentState.getSlot(src))
+        elif op == NULL:
+            newState.setSlot(dst, BitVectorPointersDomain.topElement)
+        elif op == ALLOC:
+            newState.setSlot(dst, self.siteBits[src])
+        return newState
+
+    def merge(self, abstractState1, abstractState2):
+        return abstractState1.combine(abstractState2, self.lub)
+
+    # Turns a bitmask back into the set of allocation sites used by PointersDomain
+    def decode(self, value):
+        res = set()
+        while value:
+            lowest = value & -value
+            res.add(self.sites[lowest.bit_length() - 1])
+            value ^= lowest
         return res
 
 
+# Same lattice as PointersDomain with hash-consed values: every points-to set is interned as
+# a canonical frozenset, so equal values are the same object and comparing them (also inside
+# the trees of two states) stops at the identity check. lub results are memoized in an LRU
+# cache of cacheSize entries keyed by the ids of the two values; interned values are never
+# freed, so their ids stay unique. With internStates the nodes of the state trees are
+# interned too, bottom-up, so equal states and equal subtrees share one tree and an update
+# only looks up the nodes it copied.
+class InternedPointersDomain(AbstractDomain):
+    finiteHeight = True
+    constantTransfers = True
+    defaultCacheSize = 4096
+
+    def __init__(self, cfg, cacheSize=None, internStates=False):
+        self.values = {}
+        self.bottomElement = self.intern(frozenset())
+        self.topElement = self.intern(frozenset(['null']))
+        self.siteValues = {}
+        self.cacheSize = InternedPointersDomain.defaultCacheSize if cacheSize is None else cacheSize
+        self.lubCache = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.nodes = {} if internStates else None
+        self.canonicalNodes = set()
+
+    def intern(self, value):
+        return self.values.setdefault(value, value)
+
+    # Equal states get the same tree, the first one that was built
+    def internState(self, state):
+        if self.nodes is None:
+            return state
+        root = state.root
+        if id(root) in self.canonicalNodes:
+            return state
+        root = self.internNode(root, state.index.shift)
+        if root is not state.root:
+            state = PersistentMap(state.index, root)
+        return state
+
+    # Subtrees shared with an interned tree are canonical already and are not visited again
+    def internNode(self, node, shift):
+        if shift > 0:
+            children = None
+            for position, child in enumerate(node):
+                if id(child) not in self.canonicalNodes:
+                    if children is None:
+                        children = list(node)
+                    children[position] = self.internNode(child, shift - BRANCH_BITS)
+            if children is not None:
+                node = tuple(children)
+        return self.canonicalNode(node, shift)
+
+    # The canonical node equal to node, whose children must be canonical. A leaf is looked up
+    # by its values, which are interned and hash fast, and an inner node by the ids of its
+    # children.
+    def canonicalNode(self, node, shift):
+        canonical = self.nodes.setdefault(tuple(map(id, node)) if shift else node, node)
+        self.canonicalNodes.add(id(canonical))
+        return canonical
+
+    # Writes value to the slot of a copy of state. When states are interned, the nodes the
+    # update copies are interned on the way up, so the new state is canonical as well.
+    def updateSlot(self, state, slot, value):
+        if self.nodes is None:
+            newState = state.copy()
+            newState.setSlot(slot, value)
+            return newState
+        newState = self.internState(state).copy()
+        newState.setSlot(slot, value, self.canonicalNode)
+        return newState
+
+    def lub(self, a, b):
+        if a is b:
+            return a
+        key = (id(a), id(b))
+        joined = self.lubCache.get(key)
+        if joined is not None:
+            self.hits += 1
+            self.lubCache.move_to_end(key)
+            return joined
+        self.misses += 1
+        if a is self.topElement or b is self.topElement or 'null' in a or 'null' in b:
+            joined = self.topElement
+        else:
+            joined = self.intern(a | b)
+        self.lubCache[key] = joined
+        if len(self.lubCache) > self.cacheSize:
+            self.lubCache.popitem(last=False)
+        return joined
+
+    def isEqual(self, state1, state2):
+        return state1 == state2
+
+    def statementTransfer(self, block, currentState, nextAbstractState):
+        op, dst, src = block.instr
+        if op == NOP:
+            return currentState.copy()
+        if op == COPY:
+            value = currentState.getSlot(src)
+        elif op == NULL:
+            value = self.topElement
+        else:
+            value = self.siteValues.get(src)
+            if value is None:
+                value = self.siteValues[src] = self.intern(frozenset([src]))
+        return self.updateSlot(currentState, dst, value)
+
+    def merge(self, abstractState1, abstractState2):
+        return self.internState(abstractState1.combine(abstractState2, self.lub))
+
+    # Unpickled values are copies, which are interned again. Subtrees shared by the states
+    # are rebuilt once, so they stay shared.
+    def importStates(self, states, index):
+        trees = {}
+
+        def importTree(node, shift):
+            tree = trees.get(id(node))
+            if tree is None:
+                if shift == 0:
+                    tree = tuple(self.intern(value) for value in node)
+                else:
+                    tree = tuple(importTree(child, shift - BRANCH_BITS) for child in node)
+                trees[id(node)] = tree
+            return tree
+        return [self.internState(PersistentMap(index, importTree(state.root, index.shift))) for state in states]
+
+    def decode(self, value):
+        return set(value)
+
+    def cacheStats(self):
+        stats = collections.OrderedDict([
+            ('lubHits', self.hits),
+            ('lubMisses', self.misses),
+            ('lubCacheEntries', len(self.lubCache)),
+            ('internedValues', len(self.values)),
+        ])
+        if self.nodes is not None:
+            stats['internedNodes'] = len(self.nodes)
+        return stats
+
+
+# NumPy is only imported when one of the matrix domains is selected
+def matrixDomain(cfg, packed=False):
+    from matrixDomain import MatrixPointersDomain
+    return MatrixPointersDomain(cfg, packed)
+
+
+# Builds the domain named by --domain. Several names separated by commas give a
+# ProductDomain of those domains. All domains in the table below compute the same points-to
+# sets in different representations, so such a product only cross-checks them.
+def makeDomain(spec, cfg):
+    names = spec.split(',')
+    if len(names) == 1:
+        return domains[names[0]](cfg)
+    return ProductDomain([domains[name](cfg) for name in names])
+
+
+def domainSpec(spec):
+    names = spec.split(',')
+    for name in names:
+        if name not in domains:
+            raise argparse.ArgumentTypeError('unknown domain {!r} (choose from {})'.format(name, ', '.join(sorted(domains))))
+    if len(set(names)) < len(names):
+        raise argparse.ArgumentTypeError('domain listed more than once in {!r}'.format(spec))
+    return spec
+
+
+# Abstract domains selectable with --domain. Each entry builds the domain for a given CFG.
+domains = {
+    'sets': lambda cfg: PointersDomain(),
+    'bitvector': BitVectorPointersDomain,
+    'interned': lambda cfg: InternedPointersDomain(cfg),
+    'interned-states': lambda cfg: InternedPointersDomain(cfg, internStates=True),
+    'matrix': matrixDomain,
+    'matrix-packed': lambda cfg: matrixDomain(cfg, packed=True),
+}
+
+
 if __name__ == '__main__':
-    input_file = sys.argv[1]
+    argParser = argparse.ArgumentParser(description='Pointer analysis for the pointers language')
+    argParser.add_argument('input_file')
+    argParser.add_argument('--order', choices=AbstractInterpretation.orders, default='fifo',
+                           help='order in which the fixpoint engine visits queued nodes')
+    argParser.add_argument('--widening-delay', type=int, metavar='N',
+                           help='updates of a loop head before widening is applied (default 3, domains with widening only)')
+    argParser.add_argument('--narrowing-passes', type=int, metavar='N',
+                           help='descending passes after a widened fixpoint (default 1, domains with widening only)')
+    argParser.add_argument('--dot', default='test.dot', metavar='FILE',
+                           help='write the CFG in DOT format to FILE (default test.dot, empty to skip)')
+    argParser.add_argument('--graphml', metavar='FILE', help='write the CFG in GraphML format to FILE')
+    argParser.add_argument('--networkx', action='store_true',
+                           help='write the DOT file through networkx/pygraphviz instead of cfgExport')
+    argParser.add_argument('--profile', action='store_true',
+                           help='count fixpoint work and print the hottest nodes to stderr')
+    argParser.add_argument('--profile-json', metavar='FILE',
+                           help='write the raw profile counters to FILE (implies --profile)')
+    argParser.add_argument('--profile-top', type=int, default=10, help='number of nodes in the profile report')
+    argParser.add_argument('--parser', choices=('antlr', 'fast'), default='antlr',
+                           help='parse with the ANTLR generated parser or the hand-written fastParser')
+    argParser.add_argument('--cache-dir', metavar='DIR',
+                           help='cache parsed CFGs in DIR, keyed by the program text')
+    argParser.add_argument('--cache-size', type=int, default=256, metavar='MB',
+                           help='size above which the least recently used cache entries are evicted')
+    argParser.add_argument('--check-parser', action='store_true',
+                           help='parse with both parsers and fail if the CFGs differ')
+    argParser.add_argument('--stream', action='store_true',
+                           help='read and parse the input in chunks, one top-level statement at a time '
+                                '(uses the fast parser)')
+    argParser.add_argument('--domain', type=domainSpec, default='sets',
+                           help='domain used during the analysis: {}, or several separated by commas '
+                                'to analyze them together. They all compute the same points-to sets, so '
+                                'a product only cross-checks their representations'.format(', '.join(sorted(domains))))
+    argParser.add_argument('--lub-cache-size', type=int, default=InternedPointersDomain.defaultCacheSize, metavar='N',
+                           help='entries of the lub cache of the interned domains')
+    solverGroup = argParser.add_mutually_exclusive_group()
+    solverGroup.add_argument('--sparse', action='store_true',
+                             help='propagate values along def-use chains instead of through every node')
+    solverGroup.add_argument('--blocks', action='store_true',
+                             help='iterate over basic blocks with composed transfer functions')
+    solverGroup.add_argument('--parallel', type=int, metavar='N',
+                             help='solve independent regions of the CFG in N worker processes')
+    argParser.add_argument('--parallel-grain', type=int, default=256, metavar='NODES',
+                           help='regions with fewer nodes are not handed to a worker (with --parallel)')
+    argParser.add_argument('--output', choices=resultWriter.formats, default='text',
+                           help='format of the abstract states (see resultWriter.py)')
+    argParser.add_argument('--delta', action='store_true',
+                           help='only write the variables that differ from the first predecessor')
+    argParser.add_argument('--results', metavar='FILE',
+                           help='write the abstract states to FILE instead of stdout')
+    args = argParser.parse_args()
+    if args.stream and (args.cache_dir or args.check_parser):
+        argParser.error('--stream cannot be combined with --cache-dir or --check-parser')
+    if args.output == 'binary' and ',' in args.domain:
+        argParser.error('--output binary only supports a single domain')
+    input_file = args.input_file
+    stats = None
+    timer = lambda phase: contextlib.nullcontext()
+    if args.profile or args.profile_json:
+        stats = FixpointStats()
+        timer = stats.timer
     
-    program_str = open(input_file).read()
-    input_stream = InputStream(program_str)
-    lexer = pointersLexer(input_stream)
-    stream = CommonTokenStream(lexer)
-    parser = pointersParser(stream)
-    ast = parser.program()
-    cfg = CFG(ast)
+    if not args.stream:
+        program_str = open(input_file).read()
+
+    # Before the program is parsed for the analysis, which fails if the parser rejects it
+    if args.check_parser:
+        mismatches = compareParsers(program_str)
+        for mismatch in mismatches:
+            print('[parser mismatch]', mismatch, file=sys.stderr)
+        if mismatches:
+            sys.exit(1)
+
+    if args.stream:
+        with timer('parse+cfg'):
+            with open(input_file) as f:
+                ast, cfg = streamProgram(f)
+    elif args.cache_dir:
+        with timer('parse+cfg'):
+            ast, cfg = loadProgram(program_str, args.parser, CFGCache(args.cache_dir, args.cache_size * 1024 * 1024))
+    else:
+        with timer('parse'):
+            ast = parseProgram(program_str, args.parser)
+        with timer('cfg'):
+            cfg = CFG(ast)
+
+    # The domain is made before anything is printed, so that options it does not support are
+    # rejected first
+    InternedPointersDomain.defaultCacheSize = args.lub_cache_size
+    with timer('init'):
+        domain = makeDomain(args.domain, cfg)
+        # The solvers take their own defaults for the options that were not given
+        wideningOptions = {}
+        if args.widening_delay is not None:
+            wideningOptions['wideningDelay'] = args.widening_delay
+        if args.narrowing_passes is not None:
+            wideningOptions['narrowingPasses'] = args.narrowing_passes
+        if wideningOptions and not domain.supportsWidening:
+            argParser.error('--widening-delay and --narrowing-passes need a domain that supports widening')
 
     print('--------------')
     CFG.printCFG(cfg.startNode, 0)
     # To generate an image of the CFG use the following command
     # dot -Tpng test.dot -o test.png
-    CFG.drawCFG(cfg.startNode)
+    if args.networkx:
+        cfg.drawCFG(args.dot or 'test.dot')
+    elif args.dot:
+        cfgExport.writeDot(cfg, args.dot)
+    if args.graphml:
+        cfgExport.writeGraphML(cfg, args.graphml)
     print('--------------')
 
-    absInterp = AbstractInterpretation(ast, cfg, PointersDomain)
-    absInterp.run()
-    absInterp.printAbsState()
+    with timer('init'):
+        if args.sparse:
+            absInterp = SparseInterpretation(ast, cfg, domain)
+        elif args.parallel:
+            # Imported here because parallelSolver imports this module
+            from parallelSolver import ParallelInterpretation
+            absInterp = ParallelInterpretation(ast, cfg, domain, args.parallel, args.parallel_grain)
+        elif args.blocks:
+            absInterp = BlockInterpretation(ast, cfg, domain, args.order, stats=stats, **wideningOptions)
+        else:
+            absInterp = AbstractInterpretation(ast, cfg, domain, args.order, stats=stats, **wideningOptions)
+    with timer('fixpoint'):
+        absInterp.run()
+    with timer('print'):
+        writeResults = resultWriter.writers[args.output]
+        if args.results:
+            with open(args.results, 'wb' if args.output == 'binary' else 'w') as out:
+                writeResults(absInterp, out, args.delta)
+        elif args.output == 'binary':
+            sys.stdout.flush()
+            writeResults(absInterp, sys.stdout.buffer, args.delta)
+            sys.stdout.buffer.flush()
+        else:
+            writeResults(absInterp, sys.stdout, args.delta)
     print('--------------')
+
+    if stats:
+        stats.addDomainCounters(absInterp.absDomain)
+        sys.stdout.flush()
+        stats.report(cfg, args.profile_top)
+        if args.profile_json:
+            stats.dump(args.profile_json)
@@ -0,0 +1,202 @@
+# Persistent (copy-on-write) maps used to store abstract states.
+#
+# All maps of one analysis share a KeyIndex that assigns every variable a slot. The values
+# live in a tree of tuples with BRANCH entries per node, so reading or updating a slot walks
+# O(log n) nodes. An update copies only the path to the changed leaf and every other subtree
+# is shared with the map it was copied from. copy() is O(1): the new map simply points to the
+# same tree until one of the two maps is updated.
+
+BRANCH_BITS = 5
+BRANCH = 1 << BRANCH_BITS
+MASK = BRANCH - 1
+
+
+# Assigns every key a slot. Keys are sorted so that slot numbers do not depend on the
+# iteration order of the set they were collected in.
+class KeyIndex:
+    def __init__(self, keys):
+        self.keys = sorted(keys)
+        self.slots = {key: slot for slot, key in enumerate(self.keys)}
+        self.shift = 0
+        while (BRANCH << self.shift) < len(self.keys):
+            self.shift += BRANCH_BITS
+
+    def __len__(self):
+        return len(self.keys)
+
+
+def buildTree(values, start, shift):
+    if shift == 0:
+        return tuple(values[start:start + BRANCH])
+    span = 1 << shift
+    end = min(start + (span << BRANCH_BITS), len(values))
+    return tuple(buildTree(values, lo, shift - BRANCH_BITS) for lo in range(start, end, span))
+
+
+# Returns a tree where every slot holds fn(a, b) of the corresponding slots of the two trees.
+# Subtrees that are the same object in both trees are reused as they are, which requires fn
+# to be idempotent (fn(a, a) == a). Results equal to the value of the first tree keep that
+# value, so unchanged parts of the first tree stay shared.
+def combineTrees(tree1, tree2, shift, fn):
+    if tree1 is tree2:
+        return tree1
+    if shift == 0:
+        values = []
+        changed = False
+        for a, b in zip(tree1, tree2):
+            if a is not b:
+                joined = fn(a, b)
+                if joined != a:
+                    a = joined
+                    changed = True
+            values.append(a)
+        return tuple(values) if changed else tree1
+    children = []
+    changed = False
+    for child1, child2 in zip(tree1, tree2):
+        child = combineTrees(child1, child2, shift - BRANCH_BITS, fn)
+        changed = changed or child is not child1
+        children.append(child)
+    return tuple(children) if changed else tree1
+
+
+# Appends (slot, value) for every slot whose value in tree1 differs from tree2, skipping
+# subtrees the two trees share
+def diffTrees(tree1, tree2, shift, offset, res):
+    if tree1 is tree2:
+        return
+    if shift == 0:
+        for position, (a, b) in enumerate(zip(tree1, tree2)):
+            if a is not b and a != b:
+                res.append((offset + position, a))
+        return
+    span = 1 << shift
+    for position, (child1, child2) in enumerate(zip(tree1, tree2)):
+        diffTrees(child1, child2, shift - BRANCH_BITS, offset + position * span, res)
+
+
+def treesEqual(tree1, tree2, shift):
+    if tree1 is tree2:
+        return True
+    if shift == 0:
+        return tree1 == tree2
+    for child1, child2 in zip(tree1, tree2):
+        if not treesEqual(child1, child2, shift - BRANCH_BITS):
+            return False
+    return True
+
+
+# A map from the keys of a KeyIndex to values. It supports the parts of the dict interface
+# used by the abstract domains (copy, item access, items, ...). Updating a map never
+# changes any map it was copied from or any map copied from it.
+class PersistentMap:
+    __slots__ = ('index', 'root')
+
+    def __init__(self, index, root):
+        self.index = index
+        self.root = root
+
+    def fromKeys(keys, value):
+        return PersistentMap.fromIndex(KeyIndex(keys), value)
+
+    # A map over the keys of an existing KeyIndex, so that it can be combined with other maps
+    # over the same index
+    def fromIndex(index, value):
+        return PersistentMap(index, buildTree([value] * len(index), 0, index.shift))
+
+    def copy(self):
+        return PersistentMap(self.index, self.root)
+
+    def getSlot(self, slot):
+        node = self.root
+        shift = self.index.shift
+        while shift > 0:
+            node = node[(slot >> shift) & MASK]
+            shift -= BRANCH_BITS
+        return node[slot & MASK]
+
+    # Path copying: the nodes from the root to the leaf holding the slot are rebuilt and
+    # everything else is shared with the previous tree. internNode(node, shift), if given, is
+    # applied to every rebuilt node, leaf first, and returns the node to use in its place.
+    def setSlot(self, slot, value, internNode=None):
+        path = []
+        node = self.root
+        shift = self.index.shift
+        while shift > 0:
+            position = (slot >> shift) & MASK
+            path.append((node, position))
+            node = node[position]
+            shift -= BRANCH_BITS
+        position = slot & MASK
+        if node[position] is value:
+            return
+        node = node[:position] + (value,) + node[position + 1:]
+        if internNode is not None:
+            node = internNode(node, 0)
+        for parent, position in reversed(path):
+            shift += BRANCH_BITS
+            node = parent[:position] + (node,) + parent[position + 1:]
+            if internNode is not None:
+                node = internNode(node, shift)
+        self.root = node
+
+    def combine(self, other, fn):
+        return PersistentMap(self.index, combineTrees(self.root, other.root, self.index.shift, fn))
+
+    # (key, value) pairs of this map whose value differs from the value in other
+    def diff(self, other):
+        changes = []
+        diffTrees(self.root, other.root, self.index.shift, 0, changes)
+        keys = self.index.keys
+        return [(keys[slot], value) for slot, value in changes]
+
+    def sharesStorageWith(self, other):
+        return self.root is other.root
+
+    def __getitem__(self, key):
+        return self.getSlot(self.index.slots[key])
+
+    def __setitem__(self, key, value):
+        self.setSlot(self.index.slots[key], value)
+
+    def __contains__(self, key):
+        return key in self.index.slots
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        return iter(self.index.keys)
+
+    def get(self, key, default=None):
+        if key in self.index.slots:
+            return self[key]
+        return default
+
+    def keys(self):
+        return list(self.index.keys)
+
+    def values(self):
+        res = []
+        stack = [(self.root, self.index.shift)]
+        while stack:
+            node, shift = stack.pop()
+            if shift == 0:
+                res.extend(reversed(node))
+            else:
+                stack.extend((child, shift - BRANCH_BITS) for child in node)
+        res.reverse()
+        return res
+
+    def items(self):
+        return list(zip(self.index.keys, self.values()))
+
+    def __eq__(self, other):
+        if isinstance(other, PersistentMap) and self.index is other.index:
+            return treesEqual(self.root, other.root, self.index.shift)
+        return dict(self.items()) == (dict(other.items()) if hasattr(other, 'items') else other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'PersistentMap({!r})'.format(dict(self.items()))
@@ -0,0 +1,121 @@
+# Product of several abstract domains, analyzed in a single fixpoint.
+#
+# AbstractInterpretation wraps a tuple of domains in a ProductDomain, so all analyses share
+# one CFG, one worklist and one ProductState per node, which holds the state of every
+# component. Each operation of the engine is applied to every component. The product has
+# finite height if every component has, and supports widening if some component does.
+#
+# Reduction hooks let components refine each other. A hook is called as
+# hook(block, states) with the tuple of component states after the transfer of block and
+# returns the refined tuple. Hooks must not make a state larger than it was, or the
+# fixpoint may not terminate.
+from abstractDomain import AbstractDomain
+from persistentMap import PersistentMap
+
+
+class ProductState:
+    __slots__ = ('index', 'states')
+
+    def __init__(self, index, states):
+        self.index = index
+        self.states = states
+
+    def copy(self):
+        return ProductState(self.index, tuple(state.copy() for state in self.states))
+
+    def __getitem__(self, key):
+        return tuple(state[key] for state in self.states)
+
+    def __contains__(self, key):
+        return key in self.index.slots
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        return iter(self.index.keys)
+
+    def keys(self):
+        return list(self.index.keys)
+
+    # (key, (value of every component)) pairs
+    def items(self):
+        columns = [[value for key, value in state.items()] for state in self.states]
+        return list(zip(self.index.keys, zip(*columns)))
+
+    def __eq__(self, other):
+        return isinstance(other, ProductState) and all(a == b for a, b in zip(self.states, other.states))
+
+    __hash__ = None
+
+
+class ProductDomain(AbstractDomain):
+    def __init__(self, components, reductions=()):
+        self.components = tuple(components)
+        self.reductions = tuple(reductions)
+        self.topElement = tuple(domain.topElement for domain in self.components)
+        self.bottomElement = tuple(domain.bottomElement for domain in self.components)
+        self.finiteHeight = all(domain.finiteHeight for domain in self.components)
+        self.supportsWidening = any(domain.supportsWidening for domain in self.components)
+        # Reductions may make a component's value depend on the other components
+        self.constantTransfers = not self.reductions and all(domain.constantTransfers for domain in self.components)
+        if any(hasattr(domain, 'decode') for domain in self.components):
+            self.decode = self.decodeValue
+
+    def initialState(self, index):
+        states = []
+        for domain in self.components:
+            initialState = getattr(domain, 'initialState', None)
+            states.append(initialState(index) if initialState else PersistentMap.fromIndex(index, domain.bottomElement))
+        return ProductState(index, tuple(states))
+
+    def lub(self, a, b):
+        return tuple(domain.lub(x, y) for domain, x, y in zip(self.components, a, b))
+
+    def isEqual(self, state1, state2):
+        for domain, a, b in zip(self.components, state1.states, state2.states):
+            if not domain.isEqual(a, b):
+                return False
+        return True
+
+    def statementTransfer(self, block, currentState, nextAbstractState):
+        states = tuple(domain.statementTransfer(block, a, b) for domain, a, b in
+                       zip(self.components, currentState.states, nextAbstractState.states))
+        for reduction in self.reductions:
+            states = reduction(block, states)
+        return ProductState(currentState.index, states)
+
+    def merge(self, abstractState1, abstractState2):
+        return ProductState(abstractState1.index, tuple(
+            domain.merge(a, b) for domain, a, b in zip(self.components, abstractState1.states, abstractState2.states)))
+
+    # Every component merges its own states with its (possibly batched) mergeMany
+    def mergeMany(self, states):
+        columns = zip(*(state.states for state in states))
+        return ProductState(states[0].index, tuple(domain.mergeMany(list(column)) for domain, column in zip(self.components, columns)))
+
+    # Components without widening keep the second state, which the engine computed as the
+    # merge of the old and the new state (or the recomputed state)
+    def widen(self, abstractState1, abstractState2):
+        return self.combine('widen', abstractState1, abstractState2)
+
+    def narrow(self, abstractState1, abstractState2):
+        return self.combine('narrow', abstractState1, abstractState2)
+
+    def combine(self, name, abstractState1, abstractState2):
+        states = []
+        for domain, a, b in zip(self.components, abstractState1.states, abstractState2.states):
+            states.append(getattr(domain, name)(a, b) if domain.supportsWidening else b)
+        return ProductState(abstractState1.index, tuple(states))
+
+    def importStates(self, states, index):
+        columns = [domain.importStates([state.states[position] for state in states], index)
+                   for position, domain in enumerate(self.components)]
+        return [ProductState(index, parts) for parts in zip(*columns)]
+
+    def decodeValue(self, value):
+        return tuple(domain.decode(x) if hasattr(domain, 'decode') else x for domain, x in zip(self.components, value))
+
+    # The state of one component, e.g. to print the result of one analysis
+    def component(self, state, position):
+        return state.states[position]
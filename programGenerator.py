@@ -0,0 +1,118 @@
+# Generates random programs in the language of pointers.g4, used as benchmark workloads.
+#
+#   python3 programGenerator.py --statements 5000 --depth 4 --variables 50 --sites 500 > big.c
+#
+# statements counts every statement, an if or while counts as one plus its body. depth bounds
+# the nesting of if/while, variables is the number of distinct variables and sites the
+# number of newObject statements (allocation sites) to aim for. The same seed always gives
+# the same program. Blocks are tracked on an explicit stack, so any depth can be generated.
+import argparse
+import random
+import sys
+
+
+class Block:
+    def __init__(self, kind, remaining, elseRemaining=0):
+        self.kind = kind
+        self.remaining = remaining
+        self.elseRemaining = elseRemaining
+
+
+def generateProgram(statements=100, depth=3, variables=10, sites=20, seed=0, controlRate=0.1, maxBody=20):
+    rng = random.Random(seed)
+    names = ['v{}'.format(i) for i in range(max(1, variables))]
+    allocRate = min(1.0, float(sites) / max(1, statements))
+    allocs = [0]
+    lines = []
+
+    def simpleStatement():
+        choice = rng.random()
+        if allocs[0] < sites and choice < allocRate:
+            allocs[0] += 1
+            return '{} := newObject T{}'.format(rng.choice(names), allocs[0])
+        choice = rng.random()
+        if choice < 0.1:
+            return 'skip'
+        if choice < 0.2:
+            return '{} := null'.format(rng.choice(names))
+        return '{} := {}'.format(rng.choice(names), rng.choice(names))
+
+    stack = [Block('program', max(1, statements))]
+    while stack:
+        block = stack[-1]
+        indent = '  ' * (len(stack) - 1)
+        if block.remaining == 0:
+            stack.pop()
+            if block.kind == 'if':
+                # Both branches of an if get at least one statement
+                lines.append(indent[2:] + '} else {')
+                stack.append(Block('else', block.elseRemaining))
+            elif block.kind != 'program':
+                lines.append(indent[2:] + '};')
+            continue
+        nested = len(stack) - 1 < depth and block.remaining >= 3 and rng.random() < controlRate
+        if nested:
+            body = rng.randint(2, min(block.remaining - 1, maxBody))
+            block.remaining -= body + 1
+            cond = rng.choice(names)
+            if rng.random() < 0.5:
+                thenPart = rng.randint(1, body - 1)
+                lines.append(indent + 'if ({}) {{'.format(cond))
+                stack.append(Block('if', thenPart, body - thenPart))
+            else:
+                lines.append(indent + 'while ({}) {{'.format(cond))
+                stack.append(Block('while', body))
+        else:
+            block.remaining -= 1
+            lines.append(indent + simpleStatement() + ';')
+    return '\n'.join(lines) + '\n'
+
+
+# A chain of depth while loops (or ifs with an else) nested inside each other. With allocate,
+# every level allocates a new site in its body, so states grow with the depth; without it x
+# is allocated once before the chain and copied to y at its center, which gives a large CFG
+# whose analysis is cheap.
+def generateNested(depth, kind='while', allocate=True):
+    if kind not in ('while', 'if'):
+        raise ValueError('unknown kind {!r}'.format(kind))
+    lines = [] if allocate else ['x := newObject T1;']
+    for i in range(depth):
+        lines.append('{} ({}) {{'.format(kind, 'v{}'.format(i % 10) if allocate else 'x'))
+        if allocate:
+            lines.append('v{} := newObject T{};'.format(i % 10, i))
+    lines.append('skip;' if allocate else 'y := x;')
+    if kind == 'while':
+        lines += ['};'] * depth
+    else:
+        lines += ['}} else {{ {} }};'.format('skip;' if allocate else 'y := null;')] * depth
+    return '\n'.join(lines) + '\n'
+
+
+# Programs with a large CFG whose analysis is cheap, used by run-stress-tests.sh. 'deep-while'
+# and 'deep-if' are generateNested chains of size levels without allocations; 'flat' is size
+# allocations in a row, over variables variables.
+def generateShape(shape, size, variables=10):
+    if shape == 'flat':
+        return ''.join('v{} := newObject T{};\n'.format(i % variables, i) for i in range(size))
+    if shape in ('deep-while', 'deep-if'):
+        return generateNested(size, shape[len('deep-'):], allocate=False)
+    raise ValueError('unknown shape {!r}'.format(shape))
+
+
+if __name__ == '__main__':
+    argParser = argparse.ArgumentParser(description='Generate a random pointers program')
+    argParser.add_argument('--statements', type=int, default=100)
+    argParser.add_argument('--depth', type=int, default=3, help='maximal nesting of if/while')
+    argParser.add_argument('--variables', type=int, default=10)
+    argParser.add_argument('--sites', type=int, default=20, help='number of newObject statements')
+    argParser.add_argument('--seed', type=int, default=0)
+    argParser.add_argument('--control-rate', type=float, default=0.1,
+                           help='probability that a statement opens an if or while')
+    argParser.add_argument('--shape', choices=('deep-while', 'deep-if', 'flat'),
+                           help='write a program of this shape (see generateShape) with --statements as its size')
+    args = argParser.parse_args()
+    if args.shape:
+        sys.stdout.write(generateShape(args.shape, args.statements, args.variables))
+        sys.exit(0)
+    sys.stdout.write(generateProgram(args.statements, args.depth, args.variables, args.sites,
+                                     args.seed, args.control_rate))
@@ -0,0 +1,250 @@
+# Writers for the states of a finished analysis.
+#
+# Every writer streams the states in bbid order and only holds one state at a time, so the
+# output of a large program never has to be built in memory.
+#
+#   text     the format of printAbsState: "bbid [(var, value), ...]"
+#   jsonl    one JSON object per node: {"bbid": 3, "state": {"x": [2, "null"], ...}}
+#   binary   a compact stream of variable slots and interned values (see below)
+#
+# With delta=True a node only lists the variables whose value differs from the state of its
+# first (lowest bbid) predecessor, and names that predecessor ("from" in JSONL). The start
+# node has no predecessor and is always written in full. The first predecessor of a node
+# always has a smaller bbid, so a reader can rebuild every state from the states before it.
+#
+# Binary format (all integers are unsigned LEB128 varints):
+#
+#   header   b'PTAS', version, number of variables, then every variable name (length, utf-8)
+#   record   bbid, predecessor bbid + 1 (0 for a full state), number of entries,
+#            then per entry: variable slot, value reference
+#
+# A value reference of 0 is followed by a new value (number of elements, then every element
+# as site bbid + 1, or 0 for 'null'), which gets the next free value index. Any other
+# reference is that value index + 1. Equal points-to sets are therefore stored only once.
+import json
+import sys
+
+
+MAGIC = b'PTAS'
+VERSION = 1
+formats = ('text', 'jsonl', 'binary')
+
+
+# Points-to sets become sorted lists (allocation sites first, then 'null'), the values of a
+# ProductDomain lists of their components
+def jsonValue(value):
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=lambda element: (isinstance(element, str), element))
+    if isinstance(value, tuple):
+        return [jsonValue(component) for component in value]
+    return value
+
+
+# A value as the text format shows it. The elements of a points-to set are listed in the
+# order of jsonValue, so the text does not depend on the order in which the set was built
+# (which decides the order repr lists them in).
+def textValue(value):
+    if isinstance(value, (set, frozenset)):
+        if not value:
+            return 'set()'
+        return '{' + ', '.join(repr(element) for element in jsonValue(value)) + '}'
+    if isinstance(value, tuple):
+        components = [textValue(component) for component in value]
+        return '(' + ', '.join(components) + (',)' if len(components) == 1 else ')')
+    return repr(value)
+
+
+# "[(var, value), ...]" for (variable, textValue) pairs
+def textEntries(entries):
+    return '[' + ', '.join('({!r}, {})'.format(var, text) for var, text in entries) + ']'
+
+
+# Bbid of the state a node is compared with in delta output, None for a full state
+def referenceNode(cfg, bbid, delta):
+    if delta and cfg.preds[bbid]:
+        return cfg.preds[bbid][0]
+    return None
+
+
+# (variable, raw value) pairs to write for a node, in variable order
+def stateEntries(stateMap, bbid, reference):
+    state = stateMap[bbid]
+    if reference is None:
+        return state.items()
+    previous = stateMap[reference]
+    if type(state) is type(previous) and hasattr(state, 'diff'):
+        return state.diff(previous)
+    return [(var, value) for var, value in sorted(state.items()) if previous[var] != value]
+
+
+# A hashable key that is equal for equal raw values: points-to sets become frozensets, the
+# rows of the matrix domains their bytes and the values of a ProductDomain tuples of keys
+def valueKey(value):
+    if isinstance(value, (set, frozenset)):
+        return frozenset(value)
+    if isinstance(value, tuple):
+        return tuple(valueKey(component) for component in value)
+    if hasattr(value, 'tobytes'):
+        return value.tobytes()
+    return value
+
+
+# Decodes (and converts) every distinct raw value once. A writer makes one for the states it
+# writes, so the cache lives as long as one write.
+class ValueCache:
+    def __init__(self, absDomain, convert):
+        self.decode = getattr(absDomain, 'decode', None)
+        self.convert = convert
+        self.values = {}
+
+    def __call__(self, value):
+        key = valueKey(value)
+        converted = self.values.get(key)
+        if converted is None:
+            converted = self.convert(self.decode(value) if self.decode else value)
+            self.values[key] = converted
+        return converted
+
+
+def writeText(absInterp, out, delta=False):
+    cfg = absInterp.cfg
+    value = ValueCache(absInterp.absDomain, textValue)
+    for bbid in absInterp.stateMap:
+        reference = referenceNode(cfg, bbid, delta)
+        entries = textEntries(sorted((var, value(raw)) for var, raw in stateEntries(absInterp.stateMap, bbid, reference)))
+        if reference is None:
+            out.write('{} {}\n'.format(bbid, entries))
+        else:
+            out.write('{} from {} {}\n'.format(bbid, reference, entries))
+
+
+def writeJSONL(absInterp, out, delta=False):
+    cfg = absInterp.cfg
+    value = ValueCache(absInterp.absDomain, lambda decoded: json.dumps(jsonValue(decoded)))
+    for bbid in absInterp.stateMap:
+        reference = referenceNode(cfg, bbid, delta)
+        entries = stateEntries(absInterp.stateMap, bbid, reference)
+        state = ', '.join('{}: {}'.format(json.dumps(var), value(raw)) for var, raw in sorted(entries))
+        if reference is None:
+            out.write('{{"bbid": {}, "state": {{{}}}}}\n'.format(bbid, state))
+        else:
+            out.write('{{"bbid": {}, "from": {}, "state": {{{}}}}}\n'.format(bbid, reference, state))
+
+
+def varint(n):
+    res = bytearray()
+    while n >= 0x80:
+        res.append((n & 0x7f) | 0x80)
+        n >>= 7
+    res.append(n)
+    return bytes(res)
+
+
+def encodeElement(element):
+    if element == 'null':
+        return 0
+    if isinstance(element, int):
+        return element + 1
+    raise ValueError('binary output only supports points-to sets, got element {!r}'.format(element))
+
+
+def encodeValue(value):
+    if not isinstance(value, (set, frozenset)):
+        raise ValueError('binary output only supports points-to sets, got {!r}'.format(value))
+    elements = sorted(encodeElement(element) for element in value)
+    return varint(len(elements)) + b''.join(varint(element) for element in elements)
+
+
+def writeBinary(absInterp, out, delta=False):
+    if isinstance(absInterp.absDomain.bottomElement, tuple):
+        raise ValueError('binary output only supports points-to sets, not the values of a product of domains')
+    cfg = absInterp.cfg
+    variables = sorted(absInterp.bottomState.keys())
+    slots = {var: slot for slot, var in enumerate(variables)}
+    out.write(MAGIC + varint(VERSION) + varint(len(variables)))
+    for var in variables:
+        name = var.encode()
+        out.write(varint(len(name)) + name)
+    encoded = ValueCache(absInterp.absDomain, encodeValue)
+    valueIndex = {}
+    for bbid in absInterp.stateMap:
+        reference = referenceNode(cfg, bbid, delta)
+        entries = stateEntries(absInterp.stateMap, bbid, reference)
+        record = bytearray(varint(bbid) + varint(0 if reference is None else reference + 1) + varint(len(entries)))
+        for var, raw in entries:
+            data = encoded(raw)
+            record += varint(slots[var])
+            index = valueIndex.get(data)
+            if index is None:
+                valueIndex[data] = len(valueIndex)
+                record += varint(0) + data
+            else:
+                record += varint(index + 1)
+        out.write(bytes(record))
+
+
+writers = {'text': writeText, 'jsonl': writeJSONL, 'binary': writeBinary}
+
+
+class BinaryReader:
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def varint(self):
+        n = 0
+        shift = 0
+        while True:
+            byte = self.data[self.pos]
+            self.pos += 1
+            n |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return n
+            shift += 7
+
+    def atEnd(self):
+        return self.pos >= len(self.data)
+
+
+# Yields (bbid, state) for every record of a binary stream, with delta records applied to
+# the state of their predecessor
+def readBinary(data):
+    reader = BinaryReader(data)
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError('not a binary result stream')
+    reader.pos = len(MAGIC)
+    version = reader.varint()
+    if version != VERSION:
+        raise ValueError('unsupported binary result version {}'.format(version))
+    variables = []
+    for _ in range(reader.varint()):
+        length = reader.varint()
+        variables.append(data[reader.pos:reader.pos + length].decode())
+        reader.pos += length
+    values = []
+    states = {}
+    while not reader.atEnd():
+        bbid = reader.varint()
+        reference = reader.varint()
+        state = dict(states[reference - 1]) if reference else {}
+        for _ in range(reader.varint()):
+            var = variables[reader.varint()]
+            index = reader.varint()
+            if index == 0:
+                elements = [reader.varint() for _ in range(reader.varint())]
+                values.append(frozenset(element - 1 if element else 'null' for element in elements))
+                index = len(values)
+            state[var] = set(values[index - 1])
+        states[bbid] = state
+        yield bbid, state
+
+
+# Prints a binary result file in the text format of printAbsState
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print('usage: python3 resultWriter.py RESULTS.bin', file=sys.stderr)
+        sys.exit(2)
+    with open(sys.argv[1], 'rb') as f:
+        data = f.read()
+    for bbid, state in readBinary(data):
+        print(bbid, textEntries((var, textValue(value)) for var, value in sorted(state.items())))
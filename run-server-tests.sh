@@ -0,0 +1,56 @@
+#!/bin/bash
+# Starts an analysis server on a temporary socket and runs the tests against it, then checks
+# that a malformed program is answered with an error with both parsers and that the server
+# still answers requests afterwards, and that a request that times out releases its worker.
+dir=$(mktemp -d)
+export ANALYSIS_SOCKET="$dir/server.sock"
+python3 analysisServer.py serve -j 2 --timeout 20 2> "$dir/server.log" &
+server=$!
+trap 'kill $server 2> /dev/null; wait $server 2> /dev/null; rm -rf "$dir"' EXIT
+for i in $(seq 100); do
+    [ -S "$ANALYSIS_SOCKET" ] && break
+    sleep 0.1
+done
+
+ANALYZER="python3 analysisServer.py client" ./run-tests.sh
+
+printf 'x := ;\n' > "$dir/bad.c"
+for parser in antlr fast; do
+    if python3 analysisServer.py client --parser $parser "$dir/bad.c" > /dev/null 2> "$dir/bad.err"; then
+        echo "malformed-$parser: FAIL (no error)"
+    elif grep -q 'ParseError' "$dir/bad.err"; then
+        echo "malformed-$parser: PASS"
+    else
+        echo "malformed-$parser: FAIL"
+        cat "$dir/bad.err"
+    fi
+done
+
+# Every request has been answered, so none is pending
+ANALYZER="python3 analysisServer.py client --parser fast" ./run-tests.sh | grep -v PASS
+python3 -c '
+import analysisServer, os
+stats = analysisServer.request(os.environ["ANALYSIS_SOCKET"], {"op": "stats"})["stats"]
+print("pending: PASS" if stats["pending"] == 0 and stats["failed"] == 2 else "pending: FAIL {}".format(stats))
+'
+
+# A request that times out stops its worker: a second server with one worker answers the next
+# request, and still has one worker process
+python3 analysisServer.py serve -j 1 --timeout 2 --socket "$dir/slow.sock" 2> "$dir/slow.log" &
+slow=$!
+trap 'kill $server $slow 2> /dev/null; wait $server $slow 2> /dev/null; rm -rf "$dir"' EXIT
+for i in $(seq 100); do
+    [ -S "$dir/slow.sock" ] && break
+    sleep 0.1
+done
+python3 programGenerator.py --statements 3000 --depth 5 --variables 50 --sites 1000 --seed 1 > "$dir/slow.c"
+python3 analysisServer.py client --socket "$dir/slow.sock" --parser fast "$dir/slow.c" > /dev/null 2> "$dir/slow.err"
+python3 analysisServer.py client --socket "$dir/slow.sock" tests/test1.c > "$dir/1.out" 2>> "$dir/slow.err"
+if grep -q 'timed out' "$dir/slow.err" && diff -q "$dir/1.out" tests/test1.output.correct > /dev/null &&
+        [ "$(pgrep -c -P $slow)" -eq 1 ]; then
+    echo "timeout: PASS"
+else
+    echo "timeout: FAIL"
+    cat "$dir/slow.err"
+    pgrep -a -P $slow
+fi
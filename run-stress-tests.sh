@@ -0,0 +1,35 @@
+#!/bin/bash
+# Programs too large to keep in tests/: nesting 10,000 levels deep and 100,000 statements
+# long. They are generated by programGenerator.py and analyzed with the fast parser (the
+# ANTLR parser recurses once per nesting level). Options are passed on like in run-tests.sh.
+dir=$(mktemp -d)
+trap 'rm -rf "$dir"' EXIT
+# parser.py writes the CFG to test.dot unless --dot is empty, which for the flat program
+# alone is 200,000 lines
+analyzer=${ANALYZER:-python3 parser.py --dot=}
+
+# check NAME OUTPUT LINES EXPECTED: OUTPUT has LINES lines and contains the line EXPECTED
+check() {
+    if [ "$(wc -l < "$2")" -eq "$3" ] && grep -qxF -- "$4" "$2"; then
+        echo "$1: PASS"
+    else
+        echo "$1: FAIL"
+        echo "expected $3 lines including: $4"
+        echo "got $(wc -l < "$2") lines ending with:"
+        tail -3 "$2" | cut -c1-200
+    fi
+}
+
+python3 programGenerator.py --shape deep-while --statements 10000 > "$dir/deep-while.c"
+$analyzer "$@" --parser fast "$dir/deep-while.c" > "$dir/deep-while.out"
+check deep-while "$dir/deep-while.out" 40011 "20003 [('x', {1}), ('y', {1})]"
+
+# The listing of nested ifs grows with the square of the depth, so this one is only built
+# and queried
+python3 programGenerator.py --shape deep-if --statements 10000 > "$dir/deep-if.c"
+python3 demandQuery.py --parser fast "$dir/deep-if.c" x@end y@end > "$dir/deep-if.out" 2> /dev/null
+check deep-if "$dir/deep-if.out" 2 "y@end {'null'}"
+
+python3 programGenerator.py --shape flat --statements 100000 > "$dir/flat.c"
+$analyzer "$@" --parser fast "$dir/flat.c" > "$dir/flat.out"
+check flat "$dir/flat.out" 200007 "100001 [('v0', {99991}), ('v1', {99992}), ('v2', {99993}), ('v3', {99994}), ('v4', {99995}), ('v5', {99996}), ('v6', {99997}), ('v7', {99998}), ('v8', {99999}), ('v9', {100000})]"